@@ -5,11 +5,2078 @@ import os
 import shutil
 import threading
 import queue
-from PIL import Image, ImageTk
+from PIL import Image, ImageTk, ImageSequence
 import tempfile
 import math
 import json
 import re
+import sys
+import glob
+import argparse
+import hashlib
+import uuid
+import sqlite3
+import struct
+import io
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import psutil  # 任意: あれば子プロセスのメモリ監視に使う
+except ImportError:
+    psutil = None
+
+try:
+    import tomllib  # Python 3.11以降: TOML形式のジョブファイルに使う
+except ImportError:
+    tomllib = None
+
+# 並列エンコード時の1チャンクあたりの最短秒数
+CHUNK_MIN_SECONDS = 5.0
+
+# メモリ上限の既定値（MB、0 は無制限）
+DEFAULT_MEMORY_LIMIT_MB = 2048
+# メモリ上限を超えて停止させた変換のリターンコード（128+SIGKILL の慣例）。再試行しても成功しないため失敗として扱う
+MEMORY_EXCEEDED_RETURNCODE = 137
+# split→palettegen がパレット確定までバッファするフレームの1画素あたりのバイト数（安全側の見積り）
+BUFFERED_BYTES_PER_PIXEL = 4
+# 2段階変換のパレット解析: 間引き後のFPSと縮小後の最大幅
+PALETTE_SAMPLE_FPS = 2
+PALETTE_ANALYSIS_WIDTH = 480
+# 変換結果のパレットの種類: 全フレームで解析 / 間引き・縮小したフレームで解析（2段階変換・並列エンコード）
+PALETTE_FULL = "full"
+PALETTE_SAMPLED = "sampled"
+# トリミング用フレーム索引: 1秒あたりの枚数、フレームの大きさ、保持する容量の上限（MB）、保持するJPEGの画質
+SCRUB_FPS = 1
+SCRUB_FRAME_WIDTH = 160
+SCRUB_FRAME_HEIGHT = 90
+SCRUB_CACHE_LIMIT_MB = 64
+SCRUB_JPEG_QUALITY = 85
+# プレビューで変換する区間の長さ（秒）と、表示用に保持するフレームの最大の大きさ（px）・枚数
+PREVIEW_SECONDS = 3.0
+PREVIEW_DISPLAY_SIZE = 640
+PREVIEW_MAX_FRAMES = 90
+# 子プロセスのメモリ監視間隔（秒）
+MEMORY_POLL_INTERVAL = 0.5
+
+# 永続ジョブキューの状態
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+# 一時的な失敗の最大試行回数と、再試行までの初回待ち時間（秒、以後倍々）
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BASE_DELAY = 2.0
+
+# 変換結果キャッシュ: 部分ハッシュで読む先頭/末尾ブロックの大きさと、容量上限の既定値（MB）
+PARTIAL_HASH_BLOCK = 1024 * 1024
+DEFAULT_CACHE_LIMIT_MB = 2048
+
+# ローカル変換サービスの既定ポートと、待ち行列に入れられるジョブ数の上限
+SERVICE_DEFAULT_PORT = 8765
+SERVICE_MAX_QUEUE = 16
+# 送信できる動画本体の最大サイズ（MB）と、JSONリクエストの最大サイズ（バイト）
+SERVICE_MAX_UPLOAD_MB = 2048
+SERVICE_MAX_JSON_BYTES = 1024 * 1024
+# 上限を超えたリクエストを拒否するときに読み捨てる本文の最大量（バイト）
+SERVICE_DRAIN_BYTES = 8 * 1024 * 1024
+# ジョブごとに保持する進捗ログの行数、完了したジョブを保持する時間（秒）と件数
+SERVICE_LOG_LINES = 200
+SERVICE_JOB_TTL = 3600
+SERVICE_MAX_FINISHED_JOBS = 256
+
+# 整数で指定する設定項目の範囲（最小値, 最大値）。None は上限なし
+SETTING_INT_RANGES = {
+    'fps': (1, None),
+    'width': (1, None),
+    'height': (1, None),
+    'colors': (2, 256),
+    'memory_limit_mb': (0, None),  # 0 は無制限
+}
+
+# GUIの初期値と同じ変換設定（サービスやジョブで指定されなかった項目に使う）
+DEFAULT_SETTINGS = {
+    'fps': "30",
+    'keep_fps': False,
+    'width': "640",
+    'height': "360",
+    'keep_aspect': True,
+    'keep_res': True,
+    'half_res': False,
+    'colors': "256",
+    'loop': True,
+    'trim_start': None,
+    'trim_end': None,
+    'parallel_chunks': False,
+    'memory_limit_mb': DEFAULT_MEMORY_LIMIT_MB,
+}
+
+
+def hidden_window_kwargs():
+    """Windowsでコンソールウィンドウを表示しないためのsubprocess引数を返す"""
+    if os.name != 'nt':
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {'startupinfo': startupinfo, 'creationflags': subprocess.CREATE_NO_WINDOW}
+
+
+class FFmpegCapabilities:
+    """
+    FFmpegバイナリの機能調査結果
+    - ffprobeの有無とパス
+    - 利用可能なフィルタ（paletteuseのオプション / zscale など）
+    - スレッド数を指定するオプション（並列エンコードでチャンクごとのスレッド数を制限する）
+    調査はバイナリ（実パス+更新日時）ごとに一度だけ行い、結果をキャッシュする
+    """
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, ffmpeg_path):
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = None
+        self.version = ""
+        self.filters = set()
+        self.paletteuse_options = set()
+        self.has_threads = False
+        self.has_filter_complex_threads = False
+
+    @classmethod
+    def probe(cls, ffmpeg_path):
+        """キャッシュ済みの調査結果を返す（未調査なら調査する）"""
+        try:
+            key = (os.path.realpath(ffmpeg_path), os.path.getmtime(ffmpeg_path))
+        except OSError:
+            key = (ffmpeg_path, None)
+        with cls._cache_lock:
+            caps = cls._cache.get(key)
+            if caps is None:
+                caps = cls(ffmpeg_path)
+                caps._detect()
+                cls._cache[key] = caps
+        return caps
+
+    def _run(self, command):
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='ignore',
+                timeout=30,
+                **hidden_window_kwargs()
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"機能調査コマンド失敗: {' '.join(command)}: {e}")
+            return None
+        return result
+
+    def _detect(self):
+        result = self._run([self.ffmpeg_path, '-hide_banner', '-version'])
+        if result is not None and result.stdout:
+            self.version = result.stdout.splitlines()[0].strip()
+
+        # フィルタ一覧（例: " T.C zscale   V->V   Apply resizing..."）
+        result = self._run([self.ffmpeg_path, '-hide_banner', '-filters'])
+        if result is not None:
+            for line in result.stdout.splitlines():
+                match = re.match(r'^\s*[A-Z.|]{2,3}\s+(\w+)\s+\S*->\S*', line)
+                if match:
+                    self.filters.add(match.group(1))
+
+        # paletteuseが受け付けるオプション
+        if 'paletteuse' in self.filters:
+            result = self._run([self.ffmpeg_path, '-hide_banner', '-h', 'filter=paletteuse'])
+            if result is not None:
+                for line in result.stdout.splitlines():
+                    match = re.match(r'^\s+(\w+)\s+<\w+>', line)
+                    if match:
+                        self.paletteuse_options.add(match.group(1))
+
+        # スレッド関連オプション
+        result = self._run([self.ffmpeg_path, '-hide_banner', '-h', 'full'])
+        if result is not None:
+            help_text = result.stdout
+            self.has_threads = re.search(r'^\s+-threads\s', help_text, re.M) is not None
+            self.has_filter_complex_threads = re.search(r'^\s*-filter_complex_threads\s', help_text, re.M) is not None
+
+        self.ffprobe_path = self._find_ffprobe()
+        print(f"FFmpeg機能調査: {self.version} / ffprobe={self.ffprobe_path} / "
+              f"zscale={self.has_filter('zscale')} / threads={self.has_threads} / "
+              f"filter_complex_threads={self.has_filter_complex_threads}")
+
+    def _find_ffprobe(self):
+        """ffmpegと同じ場所、次にPATHからffprobeを探し、実行できるものを返す"""
+        directory, name = os.path.split(self.ffmpeg_path)
+        candidates = []
+        if 'ffmpeg' in name.lower():
+            candidates.append(os.path.join(directory, re.sub('ffmpeg', 'ffprobe', name, flags=re.I)))
+        from_env = shutil.which("ffprobe")
+        if from_env:
+            candidates.append(from_env)
+
+        for candidate in candidates:
+            if not os.path.isfile(candidate):
+                continue
+            result = self._run([candidate, '-hide_banner', '-version'])
+            if result is not None and result.returncode == 0:
+                return candidate
+        return None
+
+    def has_filter(self, name):
+        return name in self.filters
+
+    def decode_options(self, threads=None):
+        """入力ファイルの前に置くデコードのスレッド数指定（None は ffmpeg の自動設定のまま何も付けない）"""
+        if threads is None or not self.has_threads:
+            return []
+        return ["-threads", str(threads)]
+
+    def filter_thread_options(self, threads):
+        """-lavfi のフィルタグラフのスレッド数を制限するグローバルオプション（既定は全コア）"""
+        if not self.has_filter_complex_threads:
+            return []
+        return ["-filter_complex_threads", str(threads)]
+
+    def half_scale_filter(self):
+        """解像度半分縮小のフィルタ（zscaleがあれば高速なzimgで縮小）"""
+        if self.has_filter('zscale'):
+            return "zscale=w=trunc(iw/4)*2:h=trunc(ih/4)*2:filter=lanczos"
+        return "scale=iw/2:ih/2:flags=lanczos"
+
+    def paletteuse_filter(self, dither="bayer", bayer_scale=5, diff_mode="rectangle"):
+        """このバイナリが対応するオプションだけでpaletteuseフィルタを組み立てる"""
+        if not self.paletteuse_options:
+            # 調査できなかった場合は従来どおりの指定
+            return f"paletteuse=dither={dither}:bayer_scale={bayer_scale}:diff_mode={diff_mode}"
+        options = []
+        if 'dither' in self.paletteuse_options:
+            options.append(f"dither={dither}")
+            if dither == "bayer" and 'bayer_scale' in self.paletteuse_options:
+                options.append(f"bayer_scale={bayer_scale}")
+        if 'diff_mode' in self.paletteuse_options:
+            options.append(f"diff_mode={diff_mode}")
+        return "paletteuse=" + ":".join(options) if options else "paletteuse"
+
+
+def process_rss_bytes(pid):
+    """プロセスの常駐メモリ量（バイト）を返す。取得できない環境では None"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status", encoding='ascii', errors='ignore') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("GIFデータが途中で終わっています")
+    return data
+
+
+def _read_gif_sub_blocks(f):
+    """GIFのデータサブブロック列を終端(0x00)まで読み、サイズバイトを含めてそのまま返す"""
+    blocks = bytearray()
+    while True:
+        size = _read_exact(f, 1)
+        blocks += size
+        if size[0] == 0:
+            return bytes(blocks)
+        blocks += _read_exact(f, size[0])
+
+
+def read_gif_header(f):
+    """GIFファイルの先頭から (論理画面記述子, グローバルカラーテーブル) を読む"""
+    if f.read(6) not in (b'GIF87a', b'GIF89a'):
+        raise ValueError("GIFファイルではありません")
+    screen = _read_exact(f, 7)
+    global_table = b''
+    if screen[4] & 0x80:
+        global_table = _read_exact(f, 3 * (2 << (screen[4] & 0x07)))
+    return screen, global_table
+
+
+def iter_gif_frames(f):
+    """
+    read_gif_header の続きからフレームを1つずつ読み出すジェネレータ（ファイル全体は読み込まない）
+    フレームは (グラフィック制御拡張, イメージ記述子, ローカルカラーテーブル, 画像データ) のタプル
+    ループ指定などのアプリケーション拡張・コメントは読み捨てる
+    """
+    control = b''
+    while True:
+        introducer = f.read(1)
+        if not introducer or introducer == b'\x3B':  # 終端 / トレーラ
+            return
+        if introducer == b'\x21':  # 拡張ブロック
+            label = _read_exact(f, 1)
+            block = introducer + label + _read_gif_sub_blocks(f)
+            if label[0] == 0xF9:
+                control = block
+        elif introducer == b'\x2C':  # イメージ記述子
+            descriptor = introducer + _read_exact(f, 9)
+            local_table = b''
+            if descriptor[9] & 0x80:
+                local_table = _read_exact(f, 3 * (2 << (descriptor[9] & 0x07)))
+            image = _read_exact(f, 1) + _read_gif_sub_blocks(f)  # 先頭1バイトはLZW最小コードサイズ
+            yield control, descriptor, local_table, image
+            control = b''
+        else:
+            raise ValueError(f"不正なGIFブロック: 0x{introducer[0]:02x} (位置 {f.tell() - 1})")
+
+
+def join_gif_files(input_paths, output_path, loop=True):
+    """
+    複数のGIFのフレーム列を1つのGIFに連結する
+    各フレームの表示時間（グラフィック制御拡張）はそのまま引き継ぎ、ループ指定は先頭に1つだけ書き込む
+    先頭と異なるグローバルカラーテーブルを持つGIFのフレームにはローカルカラーテーブルを付与する
+    入力はフレーム単位で読みながら書き出すため、長い出力でもメモリ使用量は1フレーム分に収まる
+    """
+    if not input_paths:
+        raise ValueError("連結するGIFがありません")
+
+    global_table = None
+    with open(output_path, 'wb') as out:
+        for path in input_paths:
+            with open(path, 'rb') as f:
+                part_screen, part_table = read_gif_header(f)
+                if global_table is None:
+                    global_table = part_table
+                    out.write(b'GIF89a' + part_screen + part_table)
+                    if loop:
+                        # NETSCAPE2.0 拡張: ループ回数0 = 無限ループ
+                        out.write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+                for control, descriptor, local_table, image in iter_gif_frames(f):
+                    if not local_table and part_table and part_table != global_table:
+                        flags = (descriptor[9] & 0x78) | 0x80 | (part_screen[4] & 0x07)
+                        descriptor = descriptor[:9] + bytes([flags])
+                        local_table = part_table
+                    out.write(control + descriptor + local_table + image)
+        out.write(b'\x3B')
+
+
+FFMPEG_CONFIG_FILE = "ffmpeg_path.txt"
+
+
+def locate_ffmpeg():
+    """設定ファイル、次にPATHからFFmpegのパスを探す（見つからなければ None）"""
+    if os.path.exists(FFMPEG_CONFIG_FILE):
+        with open(FFMPEG_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            path = f.read().strip()
+        if os.path.isfile(path) and "ffmpeg" in os.path.basename(path).lower():
+            return path
+
+    path_from_env = shutil.which("ffmpeg")
+    if path_from_env:
+        with open(FFMPEG_CONFIG_FILE, 'w', encoding='utf-8') as f:
+            f.write(path_from_env)
+        return path_from_env
+    return None
+
+
+def parse_ffprobe_output(text):
+    """ffprobeのJSON出力から動画情報（長さ・FPS・解像度）を取り出す"""
+    info = json.loads(text)
+    video_info = {'duration': float(info['format']['duration']), 'fps': None, 'width': None, 'height': None}
+    for stream in info['streams']:
+        if stream['codec_type'] == 'video':
+            video_info['width'] = stream.get('width')
+            video_info['height'] = stream.get('height')
+            fps_str = stream.get('r_frame_rate', '30/1')
+            if '/' in fps_str:
+                num, den = fps_str.split('/')
+                video_info['fps'] = float(num) / float(den)
+            else:
+                video_info['fps'] = float(fps_str)
+            break
+    return video_info
+
+
+def parse_ffmpeg_header(text):
+    """ffmpeg -i のヘッダ出力から動画情報を取り出す。Durationが無ければ None"""
+    duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})', text)
+    if not duration_match:
+        return None
+    hours = int(duration_match.group(1))
+    minutes = int(duration_match.group(2))
+    seconds = float(duration_match.group(3))
+    video_info = {'duration': hours * 3600 + minutes * 60 + seconds, 'fps': None, 'width': None, 'height': None}
+    fps_match = re.search(r'Video:.*?(\d+(?:\.\d+)?) fps', text)
+    if fps_match:
+        video_info['fps'] = float(fps_match.group(1))
+    size_match = re.search(r'Video:.*?, (\d{2,5})x(\d{2,5})', text)
+    if size_match:
+        video_info['width'] = int(size_match.group(1))
+        video_info['height'] = int(size_match.group(2))
+    return video_info
+
+
+def probe_with_ffprobe(ffprobe_path, video_file):
+    """ffprobeで動画情報を取得。失敗したら None"""
+    command = [
+        ffprobe_path,
+        '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_streams',
+        '-show_format',
+        video_file
+    ]
+    try:
+        result = subprocess.run(
+            command,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='ignore',  # デコードエラーを無視
+            **hidden_window_kwargs()
+        )
+    except FileNotFoundError:
+        print("ffprobeが見つかりません")
+        return None
+    except Exception as e:
+        print(f"ffprobe実行エラー: {e}")
+        return None
+
+    if result.returncode != 0:
+        return None
+    try:
+        return parse_ffprobe_output(result.stdout)
+    except (json.JSONDecodeError, KeyError, ValueError) as e:
+        print(f"ffprobe JSON解析エラー: {e}")
+        return None
+
+
+def probe_with_ffmpeg(ffmpeg_path, video_file):
+    """ffmpegのヘッダ出力から動画情報を取得（代替手段）。失敗したら None"""
+    # 出力を指定せずに実行するとヘッダ情報だけを表示して終了する（全フレームをデコードしない）
+    command = [ffmpeg_path, '-hide_banner', '-i', video_file]
+    try:
+        result = subprocess.run(
+            command,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='ignore',  # デコードエラーを無視
+            **hidden_window_kwargs()
+        )
+    except Exception as e:
+        print(f"ffmpegでの動画長さ取得エラー: {e}")
+        return None
+    return parse_ffmpeg_header(result.stderr if result.stderr else result.stdout)
+
+
+def probe_video_info(caps, video_file):
+    """ffprobe（無いか失敗したらffmpeg）で動画情報を取得。どちらも失敗したら None"""
+    video_info = None
+    if caps.ffprobe_path:
+        video_info = probe_with_ffprobe(caps.ffprobe_path, video_file)
+    if video_info is None:
+        video_info = probe_with_ffmpeg(caps.ffmpeg_path, video_file)
+    return video_info
+
+
+def _parse_int_setting(key, value):
+    """整数の設定値（数値または数字の文字列）を検証して返す"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str):
+        try:
+            value = int(value.strip())
+        except ValueError:
+            raise ValueError(f"{key} には整数を指定してください: {value}")
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{key} には整数を指定してください: {value!r}")
+    minimum, maximum = SETTING_INT_RANGES[key]
+    if value < minimum or (maximum is not None and value > maximum):
+        limits = f"{minimum}〜{maximum}" if maximum is not None else f"{minimum}以上"
+        raise ValueError(f"{key} は {limits} で指定してください: {value}")
+    return value
+
+
+def _parse_seconds(key, value):
+    """トリミング位置（秒）を検証して返す"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{key} には秒数を指定してください: {value!r}")
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise ValueError(f"{key} には秒数を指定してください: {value}")
+    if not math.isfinite(seconds):
+        raise ValueError(f"{key} には有限の秒数を指定してください: {value}")
+    return seconds
+
+
+def normalize_settings(overrides):
+    """
+    DEFAULT_SETTINGS に指定値を重ねた設定を返す
+    真偽値は "true"/"false"/"1"/"0" の文字列も受け付ける
+    整数の項目は SETTING_INT_RANGES の範囲を、トリミングは 0 <= 開始 < 終了 を検証する
+    未知の項目や不正な値は ValueError（変換を始める前に設定の誤りを検出する）
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError("設定はオブジェクト（テーブル）で指定してください")
+    settings = dict(DEFAULT_SETTINGS)
+    for key, value in overrides.items():
+        if key not in DEFAULT_SETTINGS:
+            raise ValueError(f"未知の設定項目: {key}")
+        default = DEFAULT_SETTINGS[key]
+        if isinstance(default, bool):
+            if isinstance(value, str):
+                if value.lower() not in ("true", "false", "1", "0"):
+                    raise ValueError(f"{key} には true/false を指定してください: {value}")
+                value = value.lower() in ("true", "1")
+            settings[key] = bool(value)
+        elif key in ('trim_start', 'trim_end'):
+            settings[key] = None if value is None else _parse_seconds(key, value)
+        else:
+            settings[key] = str(_parse_int_setting(key, value))
+    if (settings['trim_start'] is None) != (settings['trim_end'] is None):
+        raise ValueError("trim_start と trim_end は両方指定してください")
+    if settings['trim_start'] is not None and not 0 <= settings['trim_start'] < settings['trim_end']:
+        raise ValueError("トリミング範囲が不正です")
+    return settings
+
+
+def gif_output_name(file_path, trim_start=None, trim_end=None):
+    """出力GIFのファイル名（トリミング時は範囲を含める）"""
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+
+    # トリミング情報をファイル名に追加
+    if trim_start is not None and trim_end is not None:
+        start_str = f"{int(trim_start//60):02d}m{int(trim_start%60):02d}s"
+        end_str = f"{int(trim_end//60):02d}m{int(trim_end%60):02d}s"
+        base_name += f"_trim_{start_str}_{end_str}"
+
+    return f"{base_name}.gif"
+
+
+def settings_fingerprint(settings, palette=PALETTE_FULL):
+    """
+    出力GIFに影響する設定だけを正規化したJSON文字列
+    同じ結果になる設定は同じ文字列になる（使われない値・実行方法・動画から取得した情報は含めない）
+    palette は結果を作ったパレットの種類。実行方法によって色が変わるため区別する
+    """
+    normalized = {
+        'palette': palette,
+        'colors': str(settings.get('colors')).strip(),
+        'loop': bool(settings.get('loop', True)),
+        'keep_fps': bool(settings.get('keep_fps')),
+        'half_res': bool(settings.get('half_res')),
+        'keep_res': bool(settings.get('keep_res')) and not settings.get('half_res'),
+    }
+    if not normalized['keep_fps']:
+        normalized['fps'] = str(settings.get('fps')).strip()
+    if not normalized['half_res'] and not normalized['keep_res']:
+        normalized['width'] = str(settings.get('width')).strip()
+        normalized['height'] = str(settings.get('height')).strip()
+        normalized['keep_aspect'] = bool(settings.get('keep_aspect', True))
+    if settings.get('trim_start') is not None and settings.get('trim_end') is not None:
+        normalized['trim'] = [round(settings['trim_start'], 3), round(settings['trim_end'], 3)]
+    return json.dumps(normalized, sort_keys=True)
+
+
+def accepted_palettes(settings):
+    """
+    この設定の変換結果として使ってよいパレットの種類（望ましい順）
+    メモリ上限も並列エンコードも指定していなければ、全フレームで解析した結果だけを使う
+    """
+    try:
+        limited = int(settings.get('memory_limit_mb', DEFAULT_MEMORY_LIMIT_MB)) > 0
+    except (TypeError, ValueError):
+        limited = True
+    if limited or settings.get('parallel_chunks'):
+        return (PALETTE_FULL, PALETTE_SAMPLED)
+    return (PALETTE_FULL,)
+
+
+class JobQueue:
+    """
+    変換ジョブの永続キュー（出力フォルダ内のSQLite）
+    - ファイルごとに 待機/実行中/完了/失敗 と設定、入力ファイルの識別情報（更新日時+部分ハッシュ）を記録する
+    - 開いたときに「実行中」のまま残っているジョブ（前回の異常終了）は待機に戻す
+    - 出力は一時ファイルに書いてから置き換えるため、中断しても壊れたGIFは残らない
+    """
+    DB_NAME = ".mp4togif_jobs.sqlite3"
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, self.DB_NAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " input_path TEXT NOT NULL,"
+                " output_path TEXT NOT NULL,"
+                " settings TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " last_error TEXT,"
+                " updated_at REAL NOT NULL,"
+                " source TEXT,"
+                " PRIMARY KEY (input_path, output_path))"
+            )
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            if "source" not in columns:
+                # source 列が無い古い記録は、入力を確認できないため再変換の対象になる
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN source TEXT")
+            self.recovered = self.conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?", (JOB_PENDING, JOB_RUNNING)
+            ).rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def source_signature(input_path):
+        """入力ファイルの識別情報（置き換え・編集されたら変わる）。読めなければ None"""
+        try:
+            return f"{os.stat(input_path).st_mtime_ns}:{partial_file_hash(input_path)}"
+        except OSError:
+            return None
+
+    def enqueue(self, input_path, output_path, settings):
+        """
+        ジョブを登録して状態を返す
+        同じ入力・同じ設定で完了済み、かつ出力が残っている場合だけ JOB_DONE のままにし、それ以外は待機に戻す
+        （2段階変換などで作った結果は、その方法を許す設定のときだけ完了済みとみなす）
+        """
+        fingerprint = settings_fingerprint(settings)
+        accepted = {settings_fingerprint(settings, palette) for palette in accepted_palettes(settings)}
+        source = self.source_signature(input_path)
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT status, settings, source FROM jobs WHERE input_path = ? AND output_path = ?",
+                (input_path, output_path)
+            ).fetchone()
+            if (row and row[0] == JOB_DONE and row[1] in accepted and source is not None
+                    and row[2] == source and os.path.exists(output_path)):
+                return JOB_DONE
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs (input_path, output_path, settings, status, attempts, last_error, updated_at, source)"
+                " VALUES (?, ?, ?, ?, 0, NULL, ?, ?)",
+                (input_path, output_path, fingerprint, JOB_PENDING, time.time(), source)
+            )
+        return JOB_PENDING
+
+    def status(self, input_path, output_path):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM jobs WHERE input_path = ? AND output_path = ?",
+                (input_path, output_path)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _update(self, input_path, output_path, status, error=None, count_attempt=False, fingerprint=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, attempts = attempts + ?, updated_at = ?,"
+                " settings = COALESCE(?, settings)"
+                " WHERE input_path = ? AND output_path = ?",
+                (status, error, 1 if count_attempt else 0, time.time(), fingerprint, input_path, output_path)
+            )
+
+    def run(self, input_path, output_path, convert, notify, fingerprint=None):
+        """
+        ジョブを実行してリターンコードを返す
+        convert(一時出力パス) は変換を行いリターンコードを返す関数
+        fingerprint() は完了時に記録する、実際に行った変換の設定の指紋を返す関数（省略時は登録時のまま）
+        シグナルによる停止やファイル操作エラーは一時的な失敗として、待ち時間を倍々にしながら再試行する
+        メモリ上限の超過（MEMORY_EXCEEDED_RETURNCODE）は設定を変えない限り成功しないため再試行しない
+        """
+        temp_path = output_path + ".part"
+        for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+            self._update(input_path, output_path, JOB_RUNNING, count_attempt=True)
+            try:
+                returncode = convert(temp_path)
+                if returncode == 0:
+                    os.replace(temp_path, output_path)
+                    self._update(input_path, output_path, JOB_DONE,
+                                 fingerprint=fingerprint() if fingerprint else None)
+                    return 0
+                if returncode == MEMORY_EXCEEDED_RETURNCODE:
+                    error = "メモリ上限を超えたため停止しました"
+                else:
+                    error = f"エラーコード: {returncode}"
+                transient = returncode < 0 or returncode == 255
+            except OSError as e:
+                returncode = 1
+                error = str(e)
+                transient = True
+            except Exception as e:
+                self._update(input_path, output_path, JOB_FAILED, str(e))
+                raise
+            finally:
+                if os.path.exists(temp_path):
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+
+            if not transient or attempt == JOB_MAX_ATTEMPTS:
+                self._update(input_path, output_path, JOB_FAILED, error)
+                return returncode
+            delay = JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            self._update(input_path, output_path, JOB_PENDING, error)
+            notify("log", f"一時的な失敗のため {delay:.0f}秒後に再試行します（{attempt}/{JOB_MAX_ATTEMPTS}回目）: {error}")
+            time.sleep(delay)
+
+
+class GifEncoder:
+    """
+    変換設定（辞書）からFFmpegコマンドを組み立ててGIFを生成する変換処理の本体
+    - settings: Mp4ToGifConverter.collect_settings() と同じ形式の辞書
+    - notify: (種類, メッセージ) を受け取るコールバック。種類は "log" / "warning"
+    """
+    def __init__(self, ffmpeg_path, settings, notify=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.caps = FFmpegCapabilities.probe(ffmpeg_path)
+        self.settings = settings
+        self.notify = notify if notify else (lambda kind, message: print(message))
+        self.memory_exceeded = False  # 直前の run_command がメモリ上限超過で停止したか
+        self.palette = PALETTE_FULL  # 直前の変換結果のパレットの種類
+        self.rss_unavailable_logged = False  # メモリ使用量を取得できないことを通知済みか
+
+    def loop_value(self):
+        return "0" if self.settings.get('loop', True) else "-1"
+
+    def trim_range(self):
+        """トリミング範囲 (開始秒, 長さ秒) を返す。トリミングしない場合は None"""
+        start = self.settings.get('trim_start')
+        end = self.settings.get('trim_end')
+        if start is None or end is None:
+            return None
+        return start, end - start
+
+    def input_args(self, input_file, start=None, duration=None, threads=None):
+        """入力ファイル指定（シーク・長さは入力前に置いて高速シーク）"""
+        args = self.caps.decode_options(threads=threads)
+        if start is not None:
+            args.extend(["-ss", str(start)])
+        if duration is not None:
+            args.extend(["-t", str(duration)])
+        args.extend(["-i", input_file])
+        return args
+
+    def build_video_filters(self):
+        """FPS・解像度のフィルタ列を構築"""
+        settings = self.settings
+        vf_filters = []
+
+        # FPS設定の改良版
+        if not settings.get('keep_fps'):
+            try:
+                fps_val = int(settings.get('fps'))
+                if fps_val <= 0:
+                    raise ValueError("FPSは正の数である必要があります。")
+                vf_filters.append(f"fps={fps_val}")
+            except (TypeError, ValueError):
+                self.notify("warning", f"無効なFPS値: {settings.get('fps')}。デフォルトの30FPSを使用します。")
+                vf_filters.append("fps=30")
+        else:
+            # 元のFPSを維持する場合の処理
+            original_fps = settings.get('original_fps')
+            if original_fps is not None:
+                # 明示的に元のFPSを指定してフレームレートの変更を防ぐ
+                vf_filters.append(f"fps={original_fps:.6f}")
+                self.notify("log", f"元のFPSを維持: {original_fps:.3f}fps")
+            else:
+                # 元のFPSが取得できない場合は、フレームレートフィルタを適用しない
+                self.notify("log", "元のFPS情報が取得できないため、入力ファイルのフレームレートをそのまま使用します")
+
+        # 解像度設定
+        if settings.get('half_res'):
+            vf_filters.append(self.caps.half_scale_filter())
+        elif not settings.get('keep_res'):
+            try:
+                width = int(settings.get('width'))
+                height = int(settings.get('height'))
+                if width <= 0 or height <= 0:
+                    raise ValueError("解像度は正の数である必要があります。")
+
+                if settings.get('keep_aspect', True):
+                    vf_filters.append(f"scale={width}:{height}:flags=lanczos:force_original_aspect_ratio=decrease")
+                    vf_filters.append(f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
+                else:
+                    vf_filters.append(f"scale={width}:{height}:flags=lanczos")
+
+            except (TypeError, ValueError):
+                self.notify("warning", f"無効な解像度値: {settings.get('width')}x{settings.get('height')}。元の解像度を維持します。")
+
+        return vf_filters
+
+    def colors_value(self):
+        """色数設定の検証"""
+        try:
+            colors_val = int(self.settings.get('colors'))
+            if not 2 <= colors_val <= 256:
+                raise ValueError("色数は2から256の間である必要があります。")
+        except (TypeError, ValueError):
+            self.notify("warning", f"無効な色数値: {self.settings.get('colors')}。デフォルトの256色を使用します。")
+            colors_val = 256
+        return colors_val
+
+    def memory_limit_bytes(self):
+        """メモリ上限（バイト）。0以下なら無制限として None を返す"""
+        try:
+            limit_mb = int(self.settings.get('memory_limit_mb', DEFAULT_MEMORY_LIMIT_MB))
+        except (TypeError, ValueError):
+            self.notify("warning", f"無効なメモリ上限: {self.settings.get('memory_limit_mb')}。{DEFAULT_MEMORY_LIMIT_MB}MBを使用します。")
+            limit_mb = DEFAULT_MEMORY_LIMIT_MB
+        if limit_mb <= 0:
+            return None
+        return limit_mb * 1024 * 1024
+
+    def output_size(self):
+        """出力フレームの解像度 (幅, 高さ) を推定。元の解像度が不明な場合は None"""
+        settings = self.settings
+        source_width = settings.get('source_width')
+        source_height = settings.get('source_height')
+        if settings.get('half_res'):
+            return (source_width // 2, source_height // 2) if source_width and source_height else None
+        if not settings.get('keep_res'):
+            try:
+                width, height = int(settings.get('width')), int(settings.get('height'))
+                if width > 0 and height > 0:
+                    return width, height
+            except (TypeError, ValueError):
+                pass
+        return (source_width, source_height) if source_width and source_height else None
+
+    def output_fps(self):
+        """出力FPSの推定値"""
+        if self.settings.get('keep_fps'):
+            return self.settings.get('original_fps') or 30.0
+        try:
+            fps_val = int(self.settings.get('fps'))
+            return fps_val if fps_val > 0 else 30.0
+        except (TypeError, ValueError):
+            return 30.0
+
+    def estimate_single_pass_memory(self):
+        """1プロセス方式（split→palettegen）でバッファされるフレームの推定メモリ量（バイト）"""
+        size = self.output_size()
+        trim = self.trim_range()
+        duration = trim[1] if trim else self.settings.get('source_duration')
+        if not size or not duration:
+            return None
+        frames = math.ceil(duration * self.output_fps())
+        return size[0] * size[1] * BUFFERED_BYTES_PER_PIXEL * frames
+
+    def build_palette_filter(self, vf_filters, colors_val, sampled=False):
+        """
+        パレット生成のみを行うフィルタ列
+        sampled=True ではフレームを間引いて縮小した画像で統計を取り、解析のメモリと時間を抑える
+        """
+        filters = list(vf_filters)
+        if sampled:
+            filters.append(f"fps={PALETTE_SAMPLE_FPS}")
+            filters.append(f"scale='min(iw,{PALETTE_ANALYSIS_WIDTH})':-2:flags=area")
+            filters.append(f"palettegen=max_colors={colors_val}:stats_mode=full")
+        else:
+            filters.append(f"palettegen=max_colors={colors_val}:stats_mode=diff")
+        return ",".join(filters)
+
+    def build_paletteuse_graph(self, vf_filters):
+        """入力0の映像に、入力1のパレット画像を適用するフィルタグラフ"""
+        paletteuse = self.caps.paletteuse_filter()
+        if vf_filters:
+            return f"[0:v]{','.join(vf_filters)}[x];[x][1:v]{paletteuse}"
+        return f"[0:v][1:v]{paletteuse}"
+
+    def build_command(self, input_file, output_file):
+        """1プロセスでパレット生成と適用を行うコマンドを構築"""
+        trim = self.trim_range()
+        start, duration = trim if trim else (None, None)
+        command = [self.ffmpeg_path, *self.input_args(input_file, start, duration)]
+
+        vf_filters = self.build_video_filters()
+        colors_val = self.colors_value()
+
+        # パレット生成 + 適用（改良版）
+        paletteuse = self.caps.paletteuse_filter()
+        if vf_filters:
+            filter_chain = ",".join(vf_filters)
+            full_filter = f"{filter_chain},split[s0][s1];[s0]palettegen=max_colors={colors_val}:stats_mode=diff[p];[s1][p]{paletteuse}"
+        else:
+            full_filter = f"split[s0][s1];[s0]palettegen=max_colors={colors_val}:stats_mode=diff[p];[s1][p]{paletteuse}"
+
+        command.extend(["-vf", full_filter, "-loop", self.loop_value(), "-f", "gif", "-y", output_file])
+        return command
+
+    def watch_memory(self, process, memory_limit):
+        """
+        子プロセスの常駐メモリを監視し、上限を超えたら強制終了する
+        超過して停止させたときにセットされる threading.Event を返す
+        """
+        exceeded = threading.Event()
+        if not memory_limit:
+            return exceeded
+
+        def watch():
+            while process.poll() is None:
+                rss = process_rss_bytes(process.pid)
+                if rss is None:
+                    # psutil が無く /proc も無い環境（Windows など）では実行中の監視ができない
+                    if process.poll() is None and not self.rss_unavailable_logged:
+                        self.rss_unavailable_logged = True
+                        self.notify("log", "ffmpegのメモリ使用量を取得できないため、実行中のメモリ監視を行いません"
+                                           "（pip install psutil で有効になります）")
+                    return
+                if rss > memory_limit:
+                    exceeded.set()
+                    self.notify("log", f"ffmpegのメモリ使用量 {rss / 1048576:.0f}MB が上限 "
+                                       f"{memory_limit / 1048576:.0f}MB を超えたため停止します")
+                    process.kill()
+                    return
+                time.sleep(MEMORY_POLL_INTERVAL)
+
+        threading.Thread(target=watch, daemon=True).start()
+        return exceeded
+
+    def run_command(self, command, memory_limit=None):
+        """
+        コマンドを実行して出力をログに流し、リターンコードを返す
+        memory_limit（バイト）を超えた場合は停止し、self.memory_exceeded を True にして MEMORY_EXCEEDED_RETURNCODE を返す
+        """
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='ignore',  # デコードエラーを無視
+            **hidden_window_kwargs()
+        )
+        exceeded = self.watch_memory(process, memory_limit)
+        for line in iter(process.stdout.readline, ''):
+            self.notify("log", line.strip())
+        process.wait()
+        self.memory_exceeded = exceeded.is_set()
+        if self.memory_exceeded:
+            return MEMORY_EXCEEDED_RETURNCODE
+        return process.returncode
+
+    def keyframe_times(self, input_file, start, end):
+        """範囲内のキーフレーム時刻をパケット情報から取得（デコードしない）"""
+        if not self.caps.ffprobe_path:
+            return []
+        command = [
+            self.caps.ffprobe_path,
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-read_intervals', f"{start}%{end}",
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            input_file
+        ]
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='ignore',
+                timeout=120,
+                **hidden_window_kwargs()
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            self.notify("log", f"キーフレーム取得エラー: {e}")
+            return []
+
+        times = []
+        for line in result.stdout.splitlines():
+            fields = line.strip().split(',')
+            if len(fields) >= 2 and 'K' in fields[1]:
+                try:
+                    times.append(float(fields[0]))
+                except ValueError:
+                    continue
+        return sorted(times)
+
+    def plan_chunks(self, start, end, keyframes, workers):
+        """
+        [start, end) をワーカー数以下のチャンクに分割する
+        境界は理想的な等分位置に最も近いキーフレームに合わせ、近くに無ければ等分位置を使う
+        さらに出力フレームの時刻（start + k/FPS）に揃える。揃えないとチャンクごとの fps フィルタが
+        端数を丸めるため、チャンク数に応じてフレームが増える
+        """
+        duration = end - start
+        count = min(workers, int(duration // CHUNK_MIN_SECONDS))
+        if count < 2:
+            return [(start, end)]
+
+        ideal_length = duration / count
+        output_fps = self.output_fps()
+        boundaries = [start]
+        for k in range(1, count):
+            ideal = start + ideal_length * k
+            lower = boundaries[-1] + CHUNK_MIN_SECONDS / 2
+            upper = end - CHUNK_MIN_SECONDS / 2
+            candidates = [t for t in keyframes if lower <= t <= upper and abs(t - ideal) <= ideal_length / 2]
+            boundary = min(candidates, key=lambda t: abs(t - ideal)) if candidates else ideal
+            if self.settings.get('keep_fps'):
+                # 元のフレームをそのまま使う場合は、フレームとフレームの中間で切る（どちらのチャンクに入るかが揺れない）
+                boundary = (math.floor(boundary * output_fps) + 0.5) / output_fps
+            else:
+                boundary = start + round((boundary - start) * output_fps) / output_fps
+            if lower <= boundary <= upper:
+                boundaries.append(boundary)
+        boundaries.append(end)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def encode(self, input_file, output_file):
+        """
+        1プロセスで変換する
+        推定メモリが上限を超える場合、または実行中に上限を超えた場合は2段階ストリーミング変換を行う
+        """
+        self.palette = PALETTE_FULL
+        memory_limit = self.memory_limit_bytes()
+        estimate = self.estimate_single_pass_memory()
+        if memory_limit and estimate is not None and estimate > memory_limit:
+            self.notify("log", f"推定メモリ {estimate / 1048576:.0f}MB が上限 {memory_limit / 1048576:.0f}MB を"
+                               "超えるため、2段階ストリーミング変換を行います")
+            return self.encode_two_stage(input_file, output_file, memory_limit)
+
+        command = self.build_command(input_file, output_file)
+        self.notify("log", f"実行コマンド: {' '.join(command)}")
+        returncode = self.run_command(command, memory_limit)
+        if self.memory_exceeded:
+            self.notify("log", "2段階ストリーミング変換に切り替えて再実行します")
+            return self.encode_two_stage(input_file, output_file, memory_limit)
+        return returncode
+
+    def encode_two_stage(self, input_file, output_file, memory_limit=None):
+        """
+        パレット生成と適用を別プロセスに分けて変換する
+        パレット解析は間引き・縮小したフレームで行い、適用側はフレームをバッファせずに流すためメモリが一定
+        """
+        self.palette = PALETTE_SAMPLED
+        trim = self.trim_range()
+        start, duration = trim if trim else (None, None)
+        vf_filters = self.build_video_filters()
+        colors_val = self.colors_value()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            palette_path = os.path.join(temp_dir, "palette.png")
+            command = [self.ffmpeg_path, *self.input_args(input_file, start, duration),
+                       "-vf", self.build_palette_filter(vf_filters, colors_val, sampled=True),
+                       "-y", palette_path]
+            self.notify("log", f"パレット生成: {' '.join(command)}")
+            returncode = self.run_command(command, memory_limit)
+            if returncode != 0:
+                return returncode
+
+            command = [self.ffmpeg_path, *self.input_args(input_file, start, duration),
+                       "-i", palette_path,
+                       "-lavfi", self.build_paletteuse_graph(vf_filters),
+                       "-loop", self.loop_value(), "-f", "gif", "-y", output_file]
+            self.notify("log", f"パレット適用: {' '.join(command)}")
+            returncode = self.run_command(command, memory_limit)
+            if self.memory_exceeded:
+                self.notify("log", "2段階変換でもメモリ上限を超えました。解像度を下げるか、メモリ上限を増やしてください")
+            return returncode
+
+    def convert(self, input_file, output_file, video_duration, cache=None):
+        """
+        設定に応じた方法で変換する
+        cache（OutputCache）があれば結果を再利用し、無ければ変換後に、実際に使ったパレットの種類で登録する
+        """
+        cache_keys = cache.keys(input_file, self.settings) if cache else {}
+        for palette, cache_key in cache_keys.items():
+            if cache.fetch(cache_key, output_file):
+                self.palette = palette
+                self.notify("log", "同じ動画・設定の変換結果をキャッシュから再利用しました")
+                return 0
+        if self.settings.get('parallel_chunks'):
+            returncode = self.encode_chunked(input_file, output_file, video_duration)
+        else:
+            returncode = self.encode(input_file, output_file)
+        cache_key = cache_keys.get(self.palette)
+        if returncode == 0 and cache_key and not cache.store(cache_key, output_file):
+            self.notify("log", "変換結果をキャッシュに登録できませんでした（出力には影響ありません）")
+        return returncode
+
+    def encode_preview(self, input_file, output_file, video_duration, seconds=PREVIEW_SECONDS):
+        """
+        トリミング開始位置から短い区間だけを変換し、全体の出力サイズと変換時間を推定する
+        入力前シークで区間へ直接移動し、パレット解析は縮小・間引きしたフレームで行う
+        戻り値は結果の辞書（失敗時は None）
+        """
+        trim = self.trim_range()
+        range_start, range_length = trim if trim else (0.0, video_duration)
+        if range_length <= 0:
+            return None
+        sample_length = min(seconds, range_length)
+        vf_filters = self.build_video_filters()
+        colors_val = self.colors_value()
+
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            palette_path = os.path.join(temp_dir, "palette.png")
+            command = [self.ffmpeg_path, *self.input_args(input_file, range_start, sample_length),
+                       "-vf", self.build_palette_filter(vf_filters, colors_val, sampled=True),
+                       "-y", palette_path]
+            if self.run_command(command) != 0:
+                return None
+
+            command = [self.ffmpeg_path, *self.input_args(input_file, range_start, sample_length),
+                       "-i", palette_path,
+                       "-lavfi", self.build_paletteuse_graph(vf_filters),
+                       "-loop", self.loop_value(), "-f", "gif", "-y", output_file]
+            if self.run_command(command) != 0:
+                return None
+        elapsed = time.perf_counter() - started
+
+        size = os.path.getsize(output_file)
+        scale = range_length / sample_length
+        return {
+            'sample_start': range_start,
+            'sample_seconds': sample_length,
+            'elapsed': elapsed,
+            'size': size,
+            'estimated_size': size * scale,
+            'estimated_seconds': elapsed * scale,
+        }
+
+    def encode_chunked(self, input_file, output_file, video_duration):
+        """
+        変換範囲をキーフレーム境界のチャンクに分け、共通パレットで並列にエンコードして連結する
+        チャンクが1つにしかならない短い動画は通常の変換を行う
+        """
+        trim = self.trim_range()
+        start, length = trim if trim else (0.0, video_duration)
+        end = start + length
+        workers = os.cpu_count() or 1
+
+        chunks = self.plan_chunks(start, end, self.keyframe_times(input_file, start, end), workers)
+        if len(chunks) < 2:
+            self.notify("log", "分割するほど長くないため、通常の変換を行います")
+            return self.encode(input_file, output_file)
+
+        self.palette = PALETTE_SAMPLED
+        vf_filters = self.build_video_filters()
+        colors_val = self.colors_value()
+        threads_per_chunk = max(1, workers // len(chunks))
+        memory_limit = self.memory_limit_bytes()
+        chunk_memory_limit = memory_limit // len(chunks) if memory_limit else None
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 1. 変換範囲全体から共通パレットを生成（全チャンクで色を揃える）
+            #    この工程はチャンクの並列化より前に直列で走るため、間引き・縮小したフレームで解析して短くする
+            palette_path = os.path.join(temp_dir, "palette.png")
+            command = [self.ffmpeg_path, *self.input_args(input_file, start, length),
+                       "-vf", self.build_palette_filter(vf_filters, colors_val, sampled=True),
+                       "-y", palette_path]
+            self.notify("log", f"共通パレット生成: {' '.join(command)}")
+            returncode = self.run_command(command, memory_limit)
+            if returncode != 0:
+                return returncode
+
+            # 2. 各チャンクを並列にエンコード（メモリ上限はチャンク数で等分）
+            graph = self.build_paletteuse_graph(vf_filters)
+            chunk_paths = [os.path.join(temp_dir, f"chunk_{i:03d}.gif") for i in range(len(chunks))]
+
+            def encode_chunk(index):
+                chunk_start, chunk_end = chunks[index]
+                # チャンク同士でコアを取り合わないよう、デコードとフィルタのスレッド数をコア数÷チャンク数に抑える
+                command = [
+                    self.ffmpeg_path,
+                    *self.caps.filter_thread_options(threads_per_chunk),
+                    *self.input_args(input_file, chunk_start, chunk_end - chunk_start, threads=threads_per_chunk),
+                    "-i", palette_path,
+                    "-lavfi", graph,
+                    "-f", "gif", "-y", chunk_paths[index]
+                ]
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    encoding='utf-8',
+                    errors='ignore',
+                    **hidden_window_kwargs()
+                )
+                exceeded = self.watch_memory(process, chunk_memory_limit)
+                _, stderr = process.communicate()
+                return process.returncode, stderr, exceeded.is_set()
+
+            self.notify("log", f"{len(chunks)}チャンクを並列エンコード（{workers}コア）: "
+                               + ", ".join(f"{s:.2f}-{e:.2f}秒" for s, e in chunks))
+            failed = 0
+            memory_exceeded = False
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = {executor.submit(encode_chunk, i): i for i in range(len(chunks))}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    returncode, stderr, exceeded = future.result()
+                    memory_exceeded = memory_exceeded or exceeded
+                    if returncode == 0:
+                        self.notify("log", f"チャンク{index + 1}/{len(chunks)} 完了")
+                    else:
+                        self.notify("log", f"チャンク{index + 1}/{len(chunks)} 失敗 (エラーコード: {returncode})")
+                        self.notify("log", stderr[-1000:])
+                        failed = failed or returncode
+            if memory_exceeded:
+                self.notify("log", "並列エンコードがメモリ上限を超えたため、2段階ストリーミング変換で順番に処理します")
+                return self.encode_two_stage(input_file, output_file, memory_limit)
+            if failed:
+                return failed
+
+            # 3. フレーム列を連結し、ループ指定を付けて1つのGIFにする
+            join_gif_files(chunk_paths, output_file, loop=self.settings.get('loop', True))
+            self.notify("log", f"チャンクを連結: {output_file}")
+        return 0
+
+
+def load_preview_frames(gif_path, max_size=PREVIEW_DISPLAY_SIZE, max_frames=PREVIEW_MAX_FRAMES):
+    """
+    プレビュー表示用に GIF のフレームを [(画像, 表示時間ms), ...] で読み込む
+    画像は max_size 以内に縮小し、枚数が max_frames を超える場合は等間隔に間引く
+    （間引いたフレームの表示時間は直前に残したフレームに足すため、再生速度は変わらない）
+    4Kなどの大きな出力でも、保持するのは縮小したフレームだけになる
+    """
+    frames = []
+    with Image.open(gif_path) as gif:
+        total = getattr(gif, 'n_frames', 1)
+        keep_every = max(1, math.ceil(total / max_frames))
+        for index, frame in enumerate(ImageSequence.Iterator(gif)):
+            duration = frame.info.get('duration', 100)
+            if index % keep_every:
+                image, kept_duration = frames[-1]
+                frames[-1] = (image, kept_duration + duration)
+                continue
+            image = frame.convert("RGB")  # Pillowは合成済みの画面を返すため透過は不要
+            image.thumbnail((max_size, max_size))
+            frames.append((image, duration))
+    return frames
+
+
+JOB_FILE_KEYS = ("output_dir", "workers", "defaults", "items")
+JOB_ITEM_KEYS = ("input", "output", "trim", "settings")
+
+
+def load_job_file(path):
+    """
+    ジョブファイル（.json または .toml）を読み込んで検証する
+      output_dir: 出力フォルダ（省略時はジョブファイルと同じ場所の converted_gifs）
+      workers:    同時に変換する数（省略時はCPUコア数の半分）
+      defaults:   全項目に共通の設定（DEFAULT_SETTINGS の項目）
+      items:      入力の一覧。文字列（入力パス、ワイルドカード可）か、
+                  {"input", "output", "trim": [開始秒, 終了秒], "settings": {...}} のテーブル
+    相対パスはジョブファイルの場所から解決する。不正な内容は場所を示した ValueError
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("TOML形式のジョブファイルには Python 3.11 以降が必要です")
+        with open(path, 'rb') as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path}: TOMLの構文エラー: {e}")
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: JSONの構文エラー: {e}")
+
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: 最上位はオブジェクト（テーブル）である必要があります")
+    unknown = set(data) - set(JOB_FILE_KEYS)
+    if unknown:
+        raise ValueError(f"{path}: 未知の項目: {', '.join(sorted(unknown))}")
+
+    output_dir = data.get("output_dir", "converted_gifs")
+    if not isinstance(output_dir, str) or not output_dir:
+        raise ValueError(f"{path}: output_dir は文字列で指定してください")
+    workers = data.get("workers", max(1, (os.cpu_count() or 2) // 2))
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+        raise ValueError(f"{path}: workers は1以上の整数で指定してください")
+    defaults = data.get("defaults", {})
+    if not isinstance(defaults, dict):
+        raise ValueError(f"{path}: defaults はオブジェクト（テーブル）で指定してください")
+    try:
+        normalize_settings(defaults)
+    except ValueError as e:
+        raise ValueError(f"{path}: defaults: {e}")
+    raw_items = data.get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError(f"{path}: items に1つ以上の入力を指定してください")
+
+    output_dir = os.path.join(base_dir, output_dir)
+    items = []
+    for index, raw in enumerate(raw_items):
+        where = f"{path}: items[{index}]"
+        if isinstance(raw, str):
+            raw = {"input": raw}
+        if not isinstance(raw, dict):
+            raise ValueError(f"{where}: 文字列かオブジェクト（テーブル）で指定してください")
+        unknown = set(raw) - set(JOB_ITEM_KEYS)
+        if unknown:
+            raise ValueError(f"{where}: 未知の項目: {', '.join(sorted(unknown))}")
+        if not isinstance(raw.get("input"), str):
+            raise ValueError(f"{where}: input を文字列で指定してください")
+
+        overrides = dict(defaults)
+        item_settings = raw.get("settings", {})
+        if not isinstance(item_settings, dict):
+            raise ValueError(f"{where}: settings はオブジェクト（テーブル）で指定してください")
+        overrides.update(item_settings)
+        trim = raw.get("trim")
+        if trim is not None:
+            if not isinstance(trim, list) or len(trim) != 2:
+                raise ValueError(f"{where}: trim は [開始秒, 終了秒] で指定してください")
+            overrides["trim_start"], overrides["trim_end"] = trim
+        try:
+            settings = normalize_settings(overrides)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{where}: {e}")
+
+        pattern = os.path.join(base_dir, raw["input"])
+        inputs = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not inputs:
+            raise ValueError(f"{where}: 一致する入力ファイルがありません: {raw['input']}")
+        if "output" in raw and (len(inputs) != 1 or not isinstance(raw["output"], str)):
+            raise ValueError(f"{where}: output は入力が1つのときだけ文字列で指定できます")
+        for input_path in inputs:
+            if not os.path.isfile(input_path):
+                raise ValueError(f"{where}: 入力ファイルがありません: {input_path}")
+            if "output" in raw:
+                output_path = os.path.join(output_dir, raw["output"])
+            else:
+                output_path = os.path.join(output_dir, gif_output_name(input_path, settings['trim_start'], settings['trim_end']))
+            items.append({"input": os.path.normpath(input_path), "output": os.path.normpath(output_path), "settings": settings})
+
+    outputs = [item["output"] for item in items]
+    duplicates = sorted({output for output in outputs if outputs.count(output) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: 出力ファイルが重複しています: {', '.join(duplicates)}")
+    return {"output_dir": output_dir, "workers": workers, "items": items}
+
+
+def run_job_file(ffmpeg_path, path, notify, cache=None):
+    """
+    ジョブファイルをまとめて実行し、[(入力, 出力, リターンコード), ...] を返す
+    - 同じ入力の動画情報は一度だけ取得して共有する
+    - 長いジョブから順に workers 個のワーカーへ割り当て、全体の完了時刻を短くする（LPT順）
+    - 進み具合は出力フォルダの JobQueue に記録するため、中断しても同じファイルで再開できる
+    notify には "log" / "warning" に加えて "label" / "progress"（%）も通知する
+    """
+    job_file = load_job_file(path)
+    items = job_file["items"]
+    workers = job_file["workers"]
+    caps = FFmpegCapabilities.probe(ffmpeg_path)
+
+    # 動画情報の取得（同じ入力は1回だけ）
+    unique_inputs = sorted({item["input"] for item in items})
+    notify("label", f"動画情報を取得中: {len(unique_inputs)}ファイル")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        video_infos = dict(zip(unique_inputs, executor.map(lambda f: probe_video_info(caps, f), unique_inputs)))
+
+    results = []
+    scheduled = []
+    for item in items:
+        video_info = video_infos[item["input"]]
+        if video_info is None:
+            notify("log", f"動画情報を取得できないためスキップします: {item['input']}")
+            results.append((item["input"], item["output"], 1))
+            continue
+        settings = dict(item["settings"],
+                        original_fps=video_info["fps"],
+                        source_width=video_info["width"],
+                        source_height=video_info["height"],
+                        source_duration=video_info["duration"])
+        if settings["trim_start"] is not None:
+            if settings["trim_start"] >= video_info["duration"]:
+                notify("log", f"トリミング開始位置が動画の長さを超えるためスキップします: {item['input']}")
+                results.append((item["input"], item["output"], 1))
+                continue
+            settings["trim_end"] = min(settings["trim_end"], video_info["duration"])
+            length = settings["trim_end"] - settings["trim_start"]
+        else:
+            length = video_info["duration"]
+        scheduled.append((length, item, settings, video_info))
+    scheduled.sort(key=lambda entry: entry[0], reverse=True)
+
+    os.makedirs(job_file["output_dir"], exist_ok=True)
+    job_queue = JobQueue(job_file["output_dir"])
+
+    def run(entry):
+        _, item, settings, video_info = entry
+        name = os.path.basename(item["input"])
+
+        def item_notify(kind, message):
+            notify(kind, f"[{name}] {message}")
+
+        os.makedirs(os.path.dirname(item["output"]), exist_ok=True)
+        if job_queue.enqueue(item["input"], item["output"], settings) == JOB_DONE:
+            item_notify("log", "同じ設定で変換済みのためスキップします")
+            return 0
+        encoder = GifEncoder(ffmpeg_path, settings, item_notify)
+        item_notify("log", "--- 変換を開始 ---")
+        return job_queue.run(item["input"], item["output"],
+                             lambda temp_path: encoder.convert(item["input"], temp_path, video_info["duration"], cache),
+                             item_notify,
+                             fingerprint=lambda: settings_fingerprint(settings, encoder.palette))
+
+    total = len(items)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run, entry): entry[1] for entry in scheduled}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    returncode = future.result()
+                except Exception as e:
+                    notify("log", f"[{os.path.basename(item['input'])}] 変換エラー: {e}")
+                    returncode = 1
+                results.append((item["input"], item["output"], returncode))
+                status = "変換成功" if returncode == 0 else f"変換失敗 (エラーコード: {returncode})"
+                notify("log", f"[{os.path.basename(item['input'])}] --- {status} ---")
+                notify("label", f"ジョブファイル処理中: {len(results)}/{total}")
+                notify("progress", len(results) / total * 100)
+    finally:
+        job_queue.close()
+    return results
+
+
+def default_cache_dir():
+    """変換結果キャッシュの既定フォルダ（環境変数 MP4TOGIF_CACHE_DIR で共有フォルダに変更できる）"""
+    if os.environ.get('MP4TOGIF_CACHE_DIR'):
+        return os.environ['MP4TOGIF_CACHE_DIR']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'mp4togif', 'gif_cache')
+
+
+def partial_file_hash(path, block_size=PARTIAL_HASH_BLOCK):
+    """ファイルサイズと先頭・末尾ブロックだけから計算する高速なハッシュ（全体は読まない）"""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def place_file(source, destination):
+    """source を destination にハードリンク（できなければコピー）で置く。置き換えは一時ファイル経由"""
+    temp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copy2(source, temp_path)
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class OutputCache:
+    """
+    入力の内容と設定で引ける変換結果キャッシュ（フォルダやユーザーをまたいで共有できる）
+    - キー: 入力の部分ハッシュ（サイズ+先頭/末尾ブロック）+ 正規化した設定の指紋（パレットの種類を含む）
+    - 容量上限を超えたら、最後に使われた日時（ファイルの更新日時）が古いものから削除する（LRU）
+    - ヒット時はハードリンク（できなければコピー）で出力先に置くため、ffmpegを実行しない
+    """
+    def __init__(self, cache_dir=None, limit_mb=DEFAULT_CACHE_LIMIT_MB):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.limit_bytes = int(limit_mb) * 1024 * 1024
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, input_path, settings, palette=PALETTE_FULL):
+        return self.keys(input_path, settings, (palette,))[palette]
+
+    def keys(self, input_path, settings, palettes=None):
+        """この設定で使ってよいパレットの種類ごとのキー {種類: キー}（望ましい順）"""
+        input_hash = partial_file_hash(input_path)
+        return {
+            palette: hashlib.sha256(f"{input_hash}|{settings_fingerprint(settings, palette)}".encode('utf-8')).hexdigest()
+            for palette in (palettes or accepted_palettes(settings))
+        }
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.gif")
+
+    def touch(self, cached):
+        """利用日時を更新する（LRU）。読み取り専用の共有フォルダでは更新できなくてもよい"""
+        try:
+            os.utime(cached)
+        except OSError:
+            pass
+
+    def lookup(self, key):
+        """キャッシュにあれば登録済みファイルのパスを返す（無ければ None）"""
+        cached = self.path_for(key)
+        if not os.path.isfile(cached):
+            return None
+        self.touch(cached)
+        return cached
+
+    def fetch(self, key, output_path):
+        """
+        キャッシュにあれば output_path に置いて True を返す
+        キャッシュを読めない場合（共有フォルダの権限など）も、変換を妨げないよう False を返す
+        """
+        cached = self.path_for(key)
+        try:
+            place_file(cached, output_path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"キャッシュの読み込みに失敗しました: {e}")
+            return False
+        self.touch(cached)
+        return True
+
+    def store(self, key, gif_path):
+        """
+        変換結果を登録し、容量上限に収まるよう古いものを削除する
+        登録できなかった場合（容量不足・書き込み権限なしなど）は False を返す。変換結果には影響しない
+        """
+        cached = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            place_file(gif_path, cached)
+            os.utime(cached)
+        except OSError as e:
+            print(f"キャッシュへの登録に失敗しました: {e}")
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for directory, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if not name.endswith('.gif'):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.limit_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """ConversionService のHTTPリクエスト処理（service はサービス起動時に設定される）"""
+    service = None
+
+    def log_message(self, format, *args):
+        print(f"[service] {self.address_string()} {format % args}")
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self):
+        """パスを (ジョブID, 操作) に分解する。/jobs は (None, None)"""
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        if not parts or parts[0] != "jobs" or len(parts) > 3:
+            return None
+        job_id = parts[1] if len(parts) > 1 else None
+        action = parts[2] if len(parts) > 2 else None
+        return job_id, action
+
+    def do_POST(self):
+        if self.route() != (None, None):
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = 0
+        if length <= 0:
+            self.send_json(411, {"error": "Content-Length が必要です"})
+            return
+
+        content_type = self.headers.get("Content-Type", "").split(';')[0].strip()
+        limit = SERVICE_MAX_JSON_BYTES if content_type == "application/json" else self.service.max_upload_bytes
+        if length > limit:
+            self.send_json(413, {"error": f"リクエストが大きすぎます（上限 {limit // 1048576 or 1}MB）"})
+            # 送信中の本文を読まずに閉じるとクライアントが応答を受け取れないことがあるため、
+            # 一定量までは読み捨ててから閉じる（それ以上は保存も読み込みもしない）
+            self.close_connection = True
+            remaining = min(length, SERVICE_DRAIN_BYTES)
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, 65536))
+                if not block:
+                    break
+                remaining -= len(block)
+            return
+        try:
+            if content_type == "application/json":
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError("リクエストはJSONオブジェクトで指定してください")
+                if not isinstance(request.get("input"), str):
+                    raise ValueError("input を文字列で指定してください")
+                job = self.service.submit(request["input"], request.get("settings") or {})
+            else:
+                # 動画本体の送信。設定はクエリ文字列で指定する（例: ?fps=15&colors=64）
+                query = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+                job = self.service.submit_upload(self.rfile, length, query)
+        except queue.Full:
+            self.send_json(503, {"error": "待ち行列が一杯です。しばらくしてから再送してください"}, {"Retry-After": "5"})
+            return
+        except (ValueError, TypeError, OSError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(202 if job["status"] != "done" else 200, self.service.describe(job))
+
+    def do_GET(self):
+        route = self.route()
+        if route is None:
+            self.send_json(404, {"error": "not found"})
+            return
+        job_id, action = route
+        if job_id is None:
+            self.send_json(200, {"jobs": self.service.list_jobs()})
+            return
+        job = self.service.get_job(job_id)
+        if job is None:
+            self.send_json(404, {"error": "ジョブがありません"})
+            return
+
+        if action is None:
+            self.send_json(200, self.service.describe(job))
+        elif action == "progress":
+            self.stream_progress(job)
+        elif action == "result":
+            self.send_result(job)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def stream_progress(self, job):
+        """進捗を改行区切りJSONで逐次送信し、ジョブが終わったら最終状態を送って閉じる"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        for event in self.service.follow(job):
+            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+    def send_result(self, job):
+        if job["status"] != "done":
+            self.send_json(409, {"error": "変換が完了していません", "status": job["status"]})
+            return
+        try:
+            # 結果はキャッシュの容量上限で削除されることがあるため、開けたものだけを返す
+            f = open(job["output"], 'rb')
+        except FileNotFoundError:
+            self.send_json(410, {"error": "変換結果が削除されています。再度ジョブを登録してください"})
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/gif")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+
+class ConversionService:
+    """
+    変換処理をローカルHTTP APIとして提供する（--serve で起動）
+      POST /jobs                変換ジョブを登録（JSON {"input": パス, "settings": {...}} または動画本体）
+      GET  /jobs/<id>           状態を取得
+      GET  /jobs/<id>/progress  進捗ログを改行区切りJSONで逐次取得
+      GET  /jobs/<id>/result    生成したGIFを取得
+    - 決まった数のワーカースレッドで変換し、待ち行列が一杯なら 503 を返す
+    - 送信された動画本体は max_upload_mb まで（超えると 413）。uploads フォルダの使用量は
+      上限 ×（待ち行列の長さ+ワーカー数）に収まる
+    - 入力と設定が同じジョブは、変換結果キャッシュ（OutputCache）からすぐに返す
+    - 変換結果はキャッシュに登録してそこから返すため、ディスク使用量はキャッシュの容量上限に従う
+      （results フォルダは変換中の一時ファイルと、キャッシュに登録できなかった結果だけに使う）
+    """
+    FINAL_STATUSES = ("done", "failed")
+
+    def __init__(self, ffmpeg_path, work_dir, host="127.0.0.1", port=SERVICE_DEFAULT_PORT,
+                 workers=None, max_queue=SERVICE_MAX_QUEUE, cache=None, max_upload_mb=SERVICE_MAX_UPLOAD_MB):
+        self.ffmpeg_path = ffmpeg_path
+        self.caps = FFmpegCapabilities.probe(ffmpeg_path)
+        self.upload_dir = os.path.join(work_dir, "uploads")
+        self.result_dir = os.path.join(work_dir, "results")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        # 前回の実行で残った一時ファイル・結果は参照できないため削除する
+        for name in os.listdir(self.result_dir):
+            try:
+                os.remove(os.path.join(self.result_dir, name))
+            except OSError:
+                pass
+
+        self.jobs = {}
+        self.cache = cache if cache else OutputCache()
+        self.max_upload_bytes = int(max_upload_mb) * 1024 * 1024
+        self.cond = threading.Condition()
+        self.pending = queue.Queue(maxsize=max_queue)
+        self.worker_count = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.stopping = threading.Event()
+        self.threads = []
+
+        handler = type("BoundServiceRequestHandler", (ServiceRequestHandler,), {"service": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start_workers(self):
+        for _ in range(self.worker_count):
+            thread = threading.Thread(target=self.worker_loop, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def start(self):
+        """ワーカーとHTTPサーバーをバックグラウンドで起動する"""
+        self.start_workers()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def serve_forever(self):
+        self.start_workers()
+        self.server.serve_forever()
+
+    def stop(self):
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self.cond:
+            self.cond.notify_all()
+
+    def submit(self, input_path, settings, upload=False):
+        """ジョブを登録する。待ち行列が一杯なら queue.Full、入力や設定が不正なら ValueError"""
+        if not input_path or not os.path.isfile(input_path):
+            raise ValueError(f"入力ファイルがありません: {input_path}")
+        settings = normalize_settings(settings)
+        self.expire_jobs()
+        cache_keys = self.cache.keys(input_path, settings)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "input": input_path,
+            "upload": upload,
+            "settings": settings,
+            "cache_keys": cache_keys,  # 使ってよいパレットの種類ごとのキャッシュキー
+            "cache_hit": False,
+            "output": None,
+            "error": None,
+            "progress": 0.0,
+            "log": deque(maxlen=SERVICE_LOG_LINES),  # 直近の行だけを保持
+            "log_count": 0,  # これまでに追加された行数（follow が読み飛ばした行を判定する）
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        cached = self.lookup_cached(job)
+        if cached:
+            job.update(status="done", output=cached, cache_hit=True, progress=100.0, finished_at=time.time())
+            self.remove_upload(job)
+        with self.cond:
+            if job["status"] != "done":
+                self.pending.put_nowait(job["id"])
+            self.jobs[job["id"]] = job
+        return job
+
+    def submit_upload(self, stream, length, settings):
+        """送信された動画本体を一時ファイルに保存してジョブを登録する"""
+        upload_path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}.mp4")
+        remaining = length
+        with open(upload_path, 'wb') as f:
+            while remaining > 0:
+                block = stream.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        try:
+            return self.submit(upload_path, settings, upload=True)
+        except Exception:
+            os.remove(upload_path)
+            raise
+
+    def get_job(self, job_id):
+        with self.cond:
+            return self.jobs.get(job_id)
+
+    def lookup_cached(self, job):
+        """ジョブの入力・設定で使ってよい変換結果がキャッシュにあればそのパスを返す"""
+        for cache_key in job["cache_keys"].values():
+            cached = self.cache.lookup(cache_key)
+            if cached:
+                return cached
+        return None
+
+    def describe(self, job):
+        """APIで返すジョブ情報"""
+        with self.cond:
+            return {key: job[key] for key in ("id", "status", "cache_hit", "progress", "error", "created_at", "finished_at")}
+
+    def list_jobs(self):
+        with self.cond:
+            jobs = list(self.jobs.values())
+        return [self.describe(job) for job in jobs]
+
+    def follow(self, job):
+        """ジョブのログと進捗を順に返すジェネレータ。最後に最終状態を返して終わる"""
+        sent = 0
+        while True:
+            with self.cond:
+                while job["log_count"] == sent and job["status"] not in self.FINAL_STATUSES and not self.stopping.is_set():
+                    self.cond.wait(timeout=1.0)
+                # 保持行数を超えて読み遅れた分は読み飛ばす
+                unread = job["log_count"] - sent
+                lines = list(job["log"])[-unread:] if unread else []
+                sent = job["log_count"]
+                status, progress = job["status"], job["progress"]
+            for line in lines:
+                yield {"log": line, "progress": progress}
+            if status in self.FINAL_STATUSES or self.stopping.is_set():
+                yield {"status": status, "progress": progress, "error": job["error"]}
+                return
+
+    def update_job(self, job, **changes):
+        with self.cond:
+            job.update(changes)
+            self.cond.notify_all()
+
+    def remove_upload(self, job):
+        if job["upload"] and os.path.exists(job["input"]):
+            try:
+                os.remove(job["input"])
+            except OSError:
+                pass
+
+    def expire_jobs(self):
+        """完了から SERVICE_JOB_TTL 秒を過ぎたジョブと、件数の上限を超えた古い完了ジョブを削除する"""
+        now = time.time()
+        with self.cond:
+            finished = sorted((job for job in self.jobs.values() if job["finished_at"] is not None),
+                              key=lambda job: job["finished_at"])
+            excess = len(finished) - SERVICE_MAX_FINISHED_JOBS
+            expired = [job for index, job in enumerate(finished)
+                       if index < excess or now - job["finished_at"] > SERVICE_JOB_TTL]
+            for job in expired:
+                del self.jobs[job["id"]]
+        for job in expired:
+            # キャッシュに登録できなかった結果（このジョブ専用のファイル）も削除する
+            if job["output"] and os.path.dirname(job["output"]) == self.result_dir:
+                try:
+                    os.remove(job["output"])
+                except OSError:
+                    pass
+
+    def worker_loop(self):
+        while not self.stopping.is_set():
+            try:
+                job_id = self.pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            job = self.get_job(job_id)
+            try:
+                self.run_job(job)
+            except Exception as e:
+                self.update_job(job, status="failed", error=str(e), finished_at=time.time())
+            finally:
+                self.remove_upload(job)
+
+    def run_job(self, job):
+        cached = self.lookup_cached(job)
+        if cached:
+            # 待っている間に同じ入力・設定のジョブが完了していた
+            self.update_job(job, status="done", output=cached, cache_hit=True, progress=100.0, finished_at=time.time())
+            return
+
+        self.update_job(job, status="running")
+        video_info = probe_video_info(self.caps, job["input"])
+        if video_info is None:
+            self.update_job(job, status="failed", error="動画情報を取得できませんでした", finished_at=time.time())
+            return
+
+        settings = dict(job["settings"],
+                        original_fps=video_info["fps"],
+                        source_width=video_info["width"],
+                        source_height=video_info["height"],
+                        source_duration=video_info["duration"])
+        trim = (settings["trim_start"], settings["trim_end"])
+        total = trim[1] - trim[0] if None not in trim else video_info["duration"]
+
+        def notify(kind, message):
+            # ffmpegの "time=HH:MM:SS.xx" から進捗率を計算
+            match = re.search(r'time=(\d+):(\d{2}):(\d{2}(?:\.\d+)?)', message)
+            with self.cond:
+                job["log"].append(message)
+                job["log_count"] += 1
+                if match and total:
+                    elapsed = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+                    job["progress"] = min(99.0, elapsed / total * 100)
+                self.cond.notify_all()
+
+        encoder = GifEncoder(self.ffmpeg_path, settings, notify)
+        temp_path = os.path.join(self.result_dir, f"{job['id']}.gif.part")
+        try:
+            if settings["parallel_chunks"]:
+                returncode = encoder.encode_chunked(job["input"], temp_path, video_info["duration"])
+            else:
+                returncode = encoder.encode(job["input"], temp_path)
+            if returncode != 0:
+                self.update_job(job, status="failed", error=f"エラーコード: {returncode}", finished_at=time.time())
+                return
+            cache_key = job["cache_keys"].get(encoder.palette)
+            if cache_key and self.cache.store(cache_key, temp_path):
+                output_path = self.cache.path_for(cache_key)
+            else:
+                # キャッシュに登録できなくても結果は返す（このジョブ専用のファイルとして保持）
+                output_path = os.path.join(self.result_dir, f"{job['id']}.gif")
+                os.replace(temp_path, output_path)
+                notify("log", "変換結果をキャッシュに登録できませんでした（出力には影響ありません）")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.update_job(job, status="done", output=output_path, progress=100.0, finished_at=time.time())
+
+
+class FrameScrubCache:
+    """
+    トリミングバーで境界のフレームを即座に表示するための低解像度フレーム索引
+    - バックグラウンドで1本のffmpegを起動し、SCRUB_FPS 枚/秒の生フレーム(rgb24)をパイプで受け取り、JPEGに圧縮して保持する
+      （160x90 で1枚数KBのため、既定の容量上限で数時間分の動画を1秒間隔で保持できる）
+    - 容量上限を超えたら保持するフレームを1つおきに間引く。動画全体を同じ間隔で覆い、先頭側だけが欠けることはない
+    - 参照時は要求時刻に最も近い取得済みフレームを返すため、ドラッグ中にプロセスを起動しない
+    """
+    def __init__(self, ffmpeg_path, video_file, width=SCRUB_FRAME_WIDTH, height=SCRUB_FRAME_HEIGHT,
+                 fps=SCRUB_FPS, limit_mb=SCRUB_CACHE_LIMIT_MB):
+        self.ffmpeg_path = ffmpeg_path
+        self.video_file = video_file
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_size = width * height * 3
+        self.limit_bytes = limit_mb * 1024 * 1024
+        self.frames = {}  # フレーム番号 -> JPEGのバイト列
+        self.total_bytes = 0
+        self.step = 1  # 保持するフレーム番号の間隔（容量上限に達するたびに倍にする）
+        self.last_index = -1  # 保持している最後のフレーム番号
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.finished = threading.Event()  # 読み込みが終わった（または失敗した）
+        self.process = None
+
+    def start(self):
+        threading.Thread(target=self.decode, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+
+    def decode(self):
+        size_filter = (f"scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                       f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2")
+        command = [
+            self.ffmpeg_path,
+            '-i', self.video_file,
+            '-an',
+            '-vf', f"fps={self.fps},{size_filter}",
+            '-pix_fmt', 'rgb24',
+            '-f', 'rawvideo',
+            '-'
+        ]
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                **hidden_window_kwargs()
+            )
+        except OSError as e:
+            print(f"フレーム索引の作成に失敗: {e}")
+            self.finished.set()
+            return
+
+        index = 0
+        try:
+            while not self.stopped.is_set():
+                data = self.process.stdout.read(self.frame_size)
+                if len(data) < self.frame_size:
+                    break
+                if index % self.step == 0:
+                    self.add_frame(index, self.compress(data))
+                index += 1
+        finally:
+            self.process.stdout.close()
+            self.process.wait()
+            self.finished.set()
+        print(f"フレーム索引: {index}枚を読み込み（{self.step}枚ごとに {len(self.frames)}枚を保持）")
+
+    def compress(self, data):
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (self.width, self.height), data).save(buffer, format='JPEG', quality=SCRUB_JPEG_QUALITY)
+        return buffer.getvalue()
+
+    def add_frame(self, index, encoded):
+        """フレームを追加し、容量上限を超えたら間隔を倍にして間引く"""
+        with self.lock:
+            self.frames[index] = encoded
+            self.total_bytes += len(encoded)
+            while self.total_bytes > self.limit_bytes and len(self.frames) > 1:
+                self.step *= 2
+                for i in [i for i in self.frames if i % self.step]:
+                    self.total_bytes -= len(self.frames.pop(i))
+            self.last_index = index // self.step * self.step
+
+    def frame_at(self, seconds):
+        """指定時刻に最も近い取得済みフレームを (PIL画像, フレームの時刻) で返す。まだ無ければ None"""
+        target = max(0, round(seconds * self.fps))
+        with self.lock:
+            if not self.frames:
+                return None
+            # 保持しているのは 0, step, 2*step, ... last_index のフレーム
+            index = min(round(target / self.step) * self.step, self.last_index)
+            data = self.frames[index]
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image, index / self.fps
+
 
 class Mp4ToGifConverter(tk.Tk):
     """
@@ -28,6 +2095,7 @@ class Mp4ToGifConverter(tk.Tk):
             if not self.ffmpeg_path:
                 self.destroy()
                 return
+            self.ffmpeg_caps = FFmpegCapabilities.probe(self.ffmpeg_path)
 
             self.title("MP4 to GIF Converter")
             self.geometry("1200x1000")
@@ -40,6 +2108,9 @@ class Mp4ToGifConverter(tk.Tk):
             self.trim_start_ratio = 0.0
             self.trim_end_ratio = 1.0
             self.original_fps = None  # 追加: 元のFPSを保存する属性
+            self.video_width = None
+            self.video_height = None
+            self.scrub_cache = None
             
             self.setup_ui()
             self.after(100, self.process_queue)
@@ -56,18 +2127,9 @@ class Mp4ToGifConverter(tk.Tk):
 
     def find_ffmpeg_path(self):
         """FFmpegのパスを検索"""
-        config_file = "ffmpeg_path.txt"
-        if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                path = f.read().strip()
-            if os.path.isfile(path) and "ffmpeg" in os.path.basename(path).lower():
-                return path
-
-        path_from_env = shutil.which("ffmpeg")
-        if path_from_env:
-            with open(config_file, 'w', encoding='utf-8') as f:
-                f.write(path_from_env)
-            return path_from_env
+        path = locate_ffmpeg()
+        if path:
+            return path
 
         self.deiconify()
         messagebox.showinfo("FFmpegが見つかりません", 
@@ -79,7 +2141,7 @@ class Mp4ToGifConverter(tk.Tk):
         self.withdraw()
 
         if user_path and os.path.isfile(user_path):
-            with open(config_file, 'w', encoding='utf-8') as f:
+            with open(FFMPEG_CONFIG_FILE, 'w', encoding='utf-8') as f:
                 f.write(user_path)
             return user_path
         else:
@@ -128,9 +2190,19 @@ class Mp4ToGifConverter(tk.Tk):
         self.trim_canvas = tk.Canvas(self.trim_bar_frame, height=30, bg="#f0f0f0", highlightthickness=1, highlightbackground="gray")
         self.trim_canvas.pack(fill=tk.X, padx=2, pady=2)
         
+        # ドラッグ中のハンドル位置のフレーム
+        self.scrub_frame = ttk.Frame(trim_frame)
+        self.scrub_frame.grid(row=3, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        self.scrub_photo = ImageTk.PhotoImage(Image.new('RGB', (SCRUB_FRAME_WIDTH, SCRUB_FRAME_HEIGHT), color='black'))
+        self.scrub_label = tk.Label(self.scrub_frame, image=self.scrub_photo, bg="black")
+        self.scrub_label.pack(side=tk.LEFT)
+        self.scrub_time_label = ttk.Label(self.scrub_frame, text="ハンドルをドラッグすると境界のフレームを表示します")
+        self.scrub_time_label.pack(side=tk.LEFT, padx=10)
+
         # 初期状態では非表示
         self.thumbnail_frame.grid_remove()
         self.trim_bar_frame.grid_remove()
+        self.scrub_frame.grid_remove()
 
         # --- GIF出力設定 ---
         settings_frame = ttk.LabelFrame(main_frame, text="GIF出力設定", padding="10")
@@ -203,13 +2275,39 @@ class Mp4ToGifConverter(tk.Tk):
         self.is_loop = tk.BooleanVar(value=True)
         ttk.Checkbutton(settings_frame, text="無限ループさせる", variable=self.is_loop).grid(row=8, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
 
+        # 並列エンコード
+        self.parallel_chunks = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="長い動画を分割して並列エンコードする（CPUコア数に応じて高速化）",
+                        variable=self.parallel_chunks).grid(row=9, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
+        # メモリ上限
+        self.memory_limit = tk.StringVar(value=str(DEFAULT_MEMORY_LIMIT_MB))
+        ttk.Label(settings_frame, text="メモリ上限 (MB, 0=無制限):").grid(row=10, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(settings_frame, textvariable=self.memory_limit, width=7).grid(row=10, column=1, sticky=tk.W, padx=5, pady=5)
+
+        # 変換結果キャッシュ
+        self.use_cache = tk.BooleanVar(value=True)
+        self.cache_limit = tk.StringVar(value=str(DEFAULT_CACHE_LIMIT_MB))
+        cache_frame = ttk.Frame(settings_frame)
+        cache_frame.grid(row=11, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(cache_frame, text="同じ動画・同じ設定の変換結果を再利用する（キャッシュ上限 MB:",
+                        variable=self.use_cache).pack(side=tk.LEFT)
+        ttk.Entry(cache_frame, textvariable=self.cache_limit, width=7).pack(side=tk.LEFT)
+        ttk.Label(cache_frame, text="）").pack(side=tk.LEFT)
+
         # --- 実行と進捗 ---
         self.progress_label = ttk.Label(main_frame, text="待機中...")
         self.progress_label.pack(fill=tk.X, pady=(10, 0), padx=5)
         self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate")
         self.progress_bar.pack(fill=tk.X, pady=5, padx=5)
-        self.convert_button = ttk.Button(main_frame, text="変換開始", command=self.start_conversion_thread)
-        self.convert_button.pack(pady=10)
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=10)
+        self.preview_button = ttk.Button(button_frame, text="プレビュー", command=self.start_preview_thread)
+        self.preview_button.pack(side=tk.LEFT, padx=5)
+        self.job_file_button = ttk.Button(button_frame, text="ジョブファイル実行...", command=self.start_job_file_thread)
+        self.job_file_button.pack(side=tk.LEFT, padx=5)
+        self.convert_button = ttk.Button(button_frame, text="変換開始", command=self.start_conversion_thread)
+        self.convert_button.pack(side=tk.LEFT, padx=5)
 
         # --- ログ表示 ---
         log_frame = ttk.LabelFrame(main_frame, text="実行ログ", padding="10")
@@ -229,11 +2327,14 @@ class Mp4ToGifConverter(tk.Tk):
         if self.enable_trim.get():
             self.thumbnail_frame.grid()
             self.trim_bar_frame.grid()
+            self.scrub_frame.grid()
             if self.input_path.get() and not self.batch_mode.get() and self.input_path.get().lower().endswith('.mp4'):
                 self.load_video_thumbnails()
         else:
             self.thumbnail_frame.grid_remove()
             self.trim_bar_frame.grid_remove()
+            self.scrub_frame.grid_remove()
+            self.stop_frame_scrub()
 
     def load_video_thumbnails(self):
         """動画のサムネイルを生成・表示"""
@@ -260,6 +2361,9 @@ class Mp4ToGifConverter(tk.Tk):
             
             # トリミングバーを初期化
             self.init_trim_bar()
+
+            # ドラッグ用のフレーム索引をバックグラウンドで作成
+            self.start_frame_scrub(video_file)
             
         except Exception as e:
             messagebox.showerror("エラー", f"サムネイル生成エラー: {e}")
@@ -267,68 +2371,28 @@ class Mp4ToGifConverter(tk.Tk):
 
     def get_video_info(self, video_file):
         """動画の情報（長さとFPS）を取得 - 改良版"""
-        try:
-            # ffprobeがない場合はffmpegパスからffprobeのパスを推定
-            ffprobe_path = self.ffmpeg_path.replace('ffmpeg.exe', 'ffprobe.exe').replace('ffmpeg', 'ffprobe')
-            
-            # ffprobeコマンドを実行
-            command = [
-                ffprobe_path, 
-                '-v', 'quiet', 
-                '-print_format', 'json', 
-                '-show_streams',
-                '-show_format', 
-                video_file
-            ]
-            
-            startupinfo = None
-            creationflags = 0
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                creationflags = subprocess.CREATE_NO_WINDOW
-                
-            # エンコーディング問題を修正
-            result = subprocess.run(
-                command, 
-                capture_output=True, 
-                text=True,
-                encoding='utf-8',
-                errors='ignore',  # デコードエラーを無視
-                startupinfo=startupinfo, 
-                creationflags=creationflags
-            )
-            
-            if result.returncode == 0:
-                try:
-                    info = json.loads(result.stdout)
-                    
-                    # 動画の長さを取得
-                    self.video_duration = float(info['format']['duration'])
-                    
-                    # FPSを取得
-                    for stream in info['streams']:
-                        if stream['codec_type'] == 'video':
-                            fps_str = stream.get('r_frame_rate', '30/1')
-                            if '/' in fps_str:
-                                num, den = fps_str.split('/')
-                                self.original_fps = float(num) / float(den)
-                            else:
-                                self.original_fps = float(fps_str)
-                            break
-                    
-                    print(f"動画の長さ: {self.video_duration}秒, FPS: {self.original_fps}")
-                    return
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
-                    print(f"ffprobe JSON解析エラー: {e}")
-                    
-        except FileNotFoundError:
+        if not self.ffmpeg_caps.ffprobe_path:
+            # ffprobeが無いことは機能調査で分かっているので、直接ffmpegで取得
             print("ffprobeが見つかりません")
-        except Exception as e:
-            print(f"ffprobe実行エラー: {e}")
-            
-        # ffprobeが失敗した場合はffmpegで長さを取得を試す
-        self.get_duration_with_ffmpeg(video_file)
+            self.get_duration_with_ffmpeg(video_file)
+            return
+
+        video_info = probe_with_ffprobe(self.ffmpeg_caps.ffprobe_path, video_file)
+        if video_info is None:
+            # ffprobeが失敗した場合はffmpegで長さを取得を試す
+            self.get_duration_with_ffmpeg(video_file)
+            return
+
+        self.apply_video_info(video_info)
+        print(f"動画の長さ: {self.video_duration}秒, FPS: {self.original_fps}")
+
+    def apply_video_info(self, video_info):
+        self.video_duration = video_info['duration']
+        if video_info['fps'] is not None:
+            self.original_fps = video_info['fps']
+        if video_info['width'] and video_info['height']:
+            self.video_width = video_info['width']
+            self.video_height = video_info['height']
 
     def get_video_duration(self, video_file):
         """動画の長さを取得 - 改良版"""
@@ -336,47 +2400,15 @@ class Mp4ToGifConverter(tk.Tk):
 
     def get_duration_with_ffmpeg(self, video_file):
         """ffmpegを使って動画の長さを取得（代替手段） - 改良版"""
-        try:
-            command = [self.ffmpeg_path, '-i', video_file, '-f', 'null', '-']
-            
-            startupinfo = None
-            creationflags = 0
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                creationflags = subprocess.CREATE_NO_WINDOW
-                
-            # エンコーディング問題を修正
-            result = subprocess.run(
-                command, 
-                capture_output=True, 
-                text=True,
-                encoding='utf-8',
-                errors='ignore',  # デコードエラーを無視
-                startupinfo=startupinfo, 
-                creationflags=creationflags
-            )
-            
-            # ffmpegの出力からDurationを探す
-            output_text = result.stderr if result.stderr else result.stdout
-            duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})', output_text)
-            
-            if duration_match:
-                hours = int(duration_match.group(1))
-                minutes = int(duration_match.group(2))  
-                seconds = float(duration_match.group(3))
-                self.video_duration = hours * 3600 + minutes * 60 + seconds
-                print(f"ffmpegで検出した動画長さ: {self.video_duration}秒")
-                return self.video_duration
-            
-            print("Durationが見つかりませんでした")
-            self.video_duration = 60  # デフォルト値
-            return 60
-            
-        except Exception as e:
-            print(f"ffmpegでの動画長さ取得エラー: {e}")
-            self.video_duration = 60
-            return 60
+        video_info = probe_with_ffmpeg(self.ffmpeg_path, video_file)
+        if video_info:
+            self.apply_video_info(video_info)
+            print(f"ffmpegで検出した動画長さ: {self.video_duration}秒")
+            return self.video_duration
+
+        print("Durationが見つかりませんでした")
+        self.video_duration = 60  # デフォルト値
+        return 60
 
     def generate_thumbnails(self, video_file, count=8):
         """サムネイルを生成 - 改良版"""
@@ -410,11 +2442,11 @@ class Mp4ToGifConverter(tk.Tk):
                     
                     output_path = os.path.join(temp_dir, f"thumb_{i:03d}.jpg")
                     
-                    # より確実なFFmpegコマンド（改良版）
+                    # 入力前シークで高速に1枚取得（シーク位置のフレームを正確に出力する）
                     command = [
-                        self.ffmpeg_path, 
+                        self.ffmpeg_path,
+                        '-ss', str(time_pos),       # シーク位置（入力前に指定して高速シーク）
                         '-i', video_file,           # 入力ファイル
-                        '-ss', str(time_pos),       # シーク位置（入力後に指定）
                         '-vframes', '1',            # 1フレームのみ
                         '-vf', 'scale=90:50:force_original_aspect_ratio=decrease,pad=90:50:(ow-iw)/2:(oh-ih)/2',
                         '-q:v', '2',                # 高品質
@@ -585,6 +2617,43 @@ class Mp4ToGifConverter(tk.Tk):
                 self.trim_end_ratio = new_end
                 self.update_trim_display()
 
+        if self.drag_item == "end":
+            self.show_scrub_frame(self.trim_end_ratio)
+        else:
+            self.show_scrub_frame(self.trim_start_ratio)
+
+    def start_frame_scrub(self, video_file):
+        """フレーム索引の作成を開始（前の動画の索引は破棄）"""
+        self.stop_frame_scrub()
+        self.scrub_cache = FrameScrubCache(self.ffmpeg_path, video_file)
+        self.scrub_cache.start()
+
+    def stop_frame_scrub(self):
+        if self.scrub_cache:
+            self.scrub_cache.stop()
+            self.scrub_cache = None
+
+    def show_scrub_frame(self, ratio):
+        """トリミング境界の位置に最も近いフレームを表示"""
+        if not self.scrub_cache:
+            return
+        seconds = ratio * self.video_duration
+        time_str = f"{int(seconds//60):02d}:{seconds%60:05.2f}"
+        loading = not self.scrub_cache.finished.is_set()
+        found = self.scrub_cache.frame_at(seconds)
+        if found is None:
+            self.scrub_time_label.config(text=f"{time_str}（フレーム読み込み中...）" if loading
+                                         else f"{time_str}（フレームを取得できませんでした）")
+            return
+        image, frame_time = found
+        self.scrub_photo = ImageTk.PhotoImage(image)
+        self.scrub_label.config(image=self.scrub_photo)
+        if abs(frame_time - seconds) * SCRUB_FPS > 1:
+            suffix = "・読み込み中" if loading else ""
+            self.scrub_time_label.config(text=f"{time_str}（近くのフレーム {frame_time:.0f}秒を表示{suffix}）")
+        else:
+            self.scrub_time_label.config(text=time_str)
+
     def on_trim_release(self, event):
         """トリミングバーリリース時"""
         self.drag_item = None
@@ -663,6 +2732,7 @@ class Mp4ToGifConverter(tk.Tk):
 
     def toggle_input_mode(self):
         self.input_path.set("")
+        self.stop_frame_scrub()
         # サムネイルをクリア
         for widget in self.thumbnail_frame.winfo_children():
             widget.destroy()
@@ -699,6 +2769,98 @@ class Mp4ToGifConverter(tk.Tk):
         thread = threading.Thread(target=self.run_conversion, daemon=True)
         thread.start()
 
+    def start_job_file_thread(self):
+        """ジョブファイル（入力・トリミング・設定の一覧）を選んでまとめて変換する"""
+        path = filedialog.askopenfilename(
+            title="ジョブファイルを選択",
+            filetypes=[("ジョブファイル", "*.json *.toml"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.delete("1.0", tk.END)
+        self.log_text.config(state=tk.DISABLED)
+        self.convert_button.config(state=tk.DISABLED)
+        self.job_file_button.config(state=tk.DISABLED)
+        self.progress_bar["value"] = 0
+        thread = threading.Thread(target=self.run_job_file_conversion, args=(path,), daemon=True)
+        thread.start()
+
+    def run_job_file_conversion(self, path):
+        try:
+            results = run_job_file(self.ffmpeg_path, path, self.notify_progress, self.open_output_cache())
+            failed = sum(1 for result in results if result[2] != 0)
+            self.progress_queue.put(("label", f"完了: {len(results) - failed}/{len(results)}件のジョブが成功しました。"))
+            output_dirs = sorted({os.path.dirname(result[1]) for result in results})
+            self.progress_queue.put(("done", ", ".join(output_dirs)))
+        except ValueError as e:
+            self.progress_queue.put(("error", f"ジョブファイルが不正です:\n{e}"))
+        except Exception as e:
+            self.progress_queue.put(("error", f"予期せぬエラーが発生しました:\n{e}"))
+        finally:
+            self.progress_queue.put(("enable_button", None))
+
+    def start_preview_thread(self):
+        """現在の設定で短い区間だけを変換してプレビューする"""
+        video_file = self.input_path.get()
+        if self.batch_mode.get() or not video_file.lower().endswith('.mp4') or not os.path.exists(video_file):
+            messagebox.showwarning("警告", "プレビューするMP4ファイルを選択してください。")
+            return
+        self.preview_button.config(state=tk.DISABLED)
+        self.progress_label.config(text=f"プレビュー作成中（{PREVIEW_SECONDS:.0f}秒分）...")
+        thread = threading.Thread(target=self.run_preview, args=(video_file,), daemon=True)
+        thread.start()
+
+    def run_preview(self, video_file):
+        temp_dir = tempfile.mkdtemp(prefix="mp4togif_preview_")
+        try:
+            self.get_video_info(video_file)
+            def notify(kind, message):
+                # プレビューでは警告だけを表示し、ffmpegのログは流さない
+                if kind == "warning":
+                    self.progress_queue.put((kind, message))
+
+            encoder = GifEncoder(self.ffmpeg_path, self.collect_settings(), notify)
+            output_path = os.path.join(temp_dir, "preview.gif")
+            result = encoder.encode_preview(video_file, output_path, self.video_duration)
+            if result is None:
+                self.progress_queue.put(("error", "プレビューの作成に失敗しました。"))
+                return
+
+            # PhotoImage はUIスレッドで作るため、ここでは縮小したフレーム画像と表示時間だけを読み込む
+            # （サイズと変換時間の推定は実際の出力ファイルから計算済み）
+            result['frames'] = load_preview_frames(output_path)
+            self.progress_queue.put(("preview", result))
+        except Exception as e:
+            self.progress_queue.put(("error", f"プレビューの作成中にエラーが発生しました:\n{e}"))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.progress_queue.put(("enable_preview", None))
+
+    def show_preview(self, result):
+        """プレビューのアニメーションと、全体のサイズ・変換時間の推定値を表示"""
+        window = tk.Toplevel(self)
+        window.title("GIFプレビュー")
+        window.resizable(False, False)
+        window.photos = [(ImageTk.PhotoImage(image), duration) for image, duration in result['frames']]
+
+        image_label = tk.Label(window, bg="black")
+        image_label.pack(padx=10, pady=10)
+        info = (f"サンプル: {result['sample_start']:.1f}秒から{result['sample_seconds']:.1f}秒分 / "
+                f"変換 {result['elapsed']:.1f}秒, {result['size'] / 1024:.0f}KB\n"
+                f"全体の推定: サイズ 約{result['estimated_size'] / 1048576:.1f}MB / "
+                f"変換時間 約{result['estimated_seconds']:.0f}秒")
+        ttk.Label(window, text=info, justify=tk.LEFT).pack(padx=10, pady=(0, 10))
+
+        def animate(index=0):
+            if not window.winfo_exists() or not window.photos:
+                return
+            photo, duration = window.photos[index]
+            image_label.config(image=photo)
+            window.after(max(duration, 20), animate, (index + 1) % len(window.photos))
+
+        animate()
+
     def run_conversion(self):
         try:
             input_path = self.input_path.get()
@@ -718,58 +2880,53 @@ class Mp4ToGifConverter(tk.Tk):
             os.makedirs(output_dir, exist_ok=True)
             total_files = len(files_to_convert)
 
-            for i, file_path in enumerate(files_to_convert):
-                # 各ファイルの変換前に動画情報を取得
-                if not is_batch or i == 0:  # バッチ処理では最初のファイルのみ
+            output_cache = self.open_output_cache()
+
+            # 永続キューに全ファイルを登録（前回完了済みのものはスキップ対象になる）
+            job_queue = JobQueue(output_dir)
+            try:
+                if job_queue.recovered:
+                    self.progress_queue.put(("log", f"前回中断した {job_queue.recovered}件のジョブを再開します"))
+                jobs = []
+                for file_path in files_to_convert:
+                    # 登録前に動画情報を取得し、実際に変換する設定（トリミング秒数など）で記録する
+                    # （FPS維持・メモリ見積り・チャンク分割にも使う）
                     self.get_video_info(file_path)
-                
-                self.progress_queue.put(("label", f"処理中: {i+1}/{total_files} - {os.path.basename(file_path)}"))
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                
-                # トリミング情報をファイル名に追加
-                if self.enable_trim.get() and not is_batch:
-                    start_time = self.trim_start_ratio * self.video_duration
-                    end_time = self.trim_end_ratio * self.video_duration
-                    start_str = f"{int(start_time//60):02d}m{int(start_time%60):02d}s"
-                    end_str = f"{int(end_time//60):02d}m{int(end_time%60):02d}s"
-                    base_name += f"_trim_{start_str}_{end_str}"
-                
-                output_path = os.path.join(output_dir, f"{base_name}.gif")
-                command = self.build_ffmpeg_command(file_path, output_path)
-                if not command: continue
+                    settings = self.collect_settings()
+                    output_path = self.build_output_path(file_path, output_dir, is_batch)
+                    status = job_queue.enqueue(file_path, output_path, settings)
+                    jobs.append((file_path, output_path, settings, self.video_duration, status))
 
-                self.progress_queue.put(("log", f"--- 「{os.path.basename(file_path)}」の変換を開始 ---"))
-                self.progress_queue.put(("log", f"実行コマンド: {' '.join(command)}"))
+                for i, (file_path, output_path, settings, duration, status) in enumerate(jobs):
+                    self.progress_queue.put(("label", f"処理中: {i+1}/{total_files} - {os.path.basename(file_path)}"))
+                    if status == JOB_DONE:
+                        self.progress_queue.put(("log", f"「{os.path.basename(file_path)}」は同じ設定で変換済みのためスキップします"))
+                        self.progress_queue.put(("progress", ((i + 1) / total_files) * 100))
+                        continue
 
-                startupinfo = None
-                creationflags = 0
-                if os.name == 'nt':
-                    startupinfo = subprocess.STARTUPINFO()
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                    creationflags = subprocess.CREATE_NO_WINDOW
+                    encoder = GifEncoder(self.ffmpeg_path, settings, self.notify_progress)
 
-                # エンコーディング問題を修正したプロセス実行
-                process = subprocess.Popen(
-                    command, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.STDOUT,
-                    text=True, 
-                    encoding='utf-8', 
-                    errors='ignore',  # デコードエラーを無視
-                    startupinfo=startupinfo, 
-                    creationflags=creationflags
-                )
+                    def convert(temp_path, encoder=encoder, file_path=file_path, duration=duration):
+                        return encoder.convert(file_path, temp_path, duration, output_cache)
 
-                for line in iter(process.stdout.readline, ''):
-                    self.progress_queue.put(("log", line.strip()))
-                process.wait()
+                    def fingerprint(encoder=encoder, settings=settings):
+                        return settings_fingerprint(settings, encoder.palette)
 
-                if process.returncode == 0:
-                    self.progress_queue.put(("log", f"--- 変換成功 ---\n"))
-                else:
-                    self.progress_queue.put(("log", f"--- 変換失敗 (エラーコード: {process.returncode}) ---\n"))
+                    self.progress_queue.put(("log", f"--- 「{os.path.basename(file_path)}」の変換を開始 ---"))
+                    try:
+                        returncode = job_queue.run(file_path, output_path, convert, self.notify_progress, fingerprint)
+                    except Exception as e:
+                        self.progress_queue.put(("warning", f"変換エラー: {e}"))
+                        continue
 
-                self.progress_queue.put(("progress", ((i + 1) / total_files) * 100))
+                    if returncode == 0:
+                        self.progress_queue.put(("log", f"--- 変換成功 ---\n"))
+                    else:
+                        self.progress_queue.put(("log", f"--- 変換失敗 (エラーコード: {returncode}) ---\n"))
+
+                    self.progress_queue.put(("progress", ((i + 1) / total_files) * 100))
+            finally:
+                job_queue.close()
 
             self.progress_queue.put(("label", f"完了: {total_files}個のファイルの処理が完了しました。"))
             self.progress_queue.put(("done", output_dir))
@@ -779,81 +2936,66 @@ class Mp4ToGifConverter(tk.Tk):
         finally:
             self.progress_queue.put(("enable_button", None))
 
-    def build_ffmpeg_command(self, input_file, output_file):
-        """FFmpegコマンドを構築 - 改良版"""
+    def open_output_cache(self):
+        """変換結果キャッシュを開く（無効、または開けない場合は None）"""
+        if not self.use_cache.get():
+            return None
         try:
-            loop = "0" if self.is_loop.get() else "-1"
-            command = [self.ffmpeg_path, "-i", input_file]
-            
-            # トリミング設定の追加
-            if self.enable_trim.get():
-                start_time = self.trim_start_ratio * self.video_duration
-                end_time = self.trim_end_ratio * self.video_duration
-                duration = end_time - start_time
-                
-                command.extend(["-ss", str(start_time)])
-                command.extend(["-t", str(duration)])
-            
-            vf_filters = []
-
-            # FPS設定の改良版
-            if not self.keep_fps.get():
-                try:
-                    fps_val = int(self.fps.get())
-                    if fps_val <= 0: 
-                        raise ValueError("FPSは正の数である必要があります。")
-                    vf_filters.append(f"fps={fps_val}")
-                except ValueError as e:
-                    self.progress_queue.put(("warning", f"無効なFPS値: {self.fps.get()}。デフォルトの30FPSを使用します。"))
-                    vf_filters.append("fps=30")
-            else:
-                # 元のFPSを維持する場合の処理
-                if self.original_fps is not None:
-                    # 明示的に元のFPSを指定してフレームレートの変更を防ぐ
-                    vf_filters.append(f"fps={self.original_fps:.6f}")
-                    self.progress_queue.put(("log", f"元のFPSを維持: {self.original_fps:.3f}fps"))
-                else:
-                    # 元のFPSが取得できない場合は、フレームレートフィルタを適用しない
-                    self.progress_queue.put(("log", "元のFPS情報が取得できないため、入力ファイルのフレームレートをそのまま使用します"))
-
-            # 解像度設定
-            if self.half_res.get():
-                vf_filters.append("scale=iw/2:ih/2:flags=lanczos")
-            elif not self.keep_res.get():
-                try:
-                    width = int(self.width.get())
-                    height = int(self.height.get())
-                    if width <= 0 or height <= 0:
-                        raise ValueError("解像度は正の数である必要があります。")
-                    
-                    if self.keep_aspect.get():
-                        vf_filters.append(f"scale={width}:{height}:flags=lanczos:force_original_aspect_ratio=decrease")
-                        vf_filters.append(f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
-                    else:
-                        vf_filters.append(f"scale={width}:{height}:flags=lanczos")
-                        
-                except ValueError as e:
-                    self.progress_queue.put(("warning", f"無効な解像度値: {self.width.get()}x{self.height.get()}。元の解像度を維持します。"))
+            limit_mb = int(self.cache_limit.get())
+            if limit_mb <= 0:
+                raise ValueError("キャッシュ上限は正の数である必要があります。")
+        except ValueError:
+            self.progress_queue.put(("warning", f"無効なキャッシュ上限: {self.cache_limit.get()}。{DEFAULT_CACHE_LIMIT_MB}MBを使用します。"))
+            limit_mb = DEFAULT_CACHE_LIMIT_MB
+        try:
+            return OutputCache(limit_mb=limit_mb)
+        except OSError as e:
+            self.progress_queue.put(("log", f"キャッシュフォルダを開けないため、キャッシュを使わずに変換します: {e}"))
+            return None
 
-            # 色数設定の検証
-            try:
-                colors_val = int(self.colors.get())
-                if not 2 <= colors_val <= 256:
-                    raise ValueError("色数は2から256の間である必要があります。")
-            except ValueError:
-                self.progress_queue.put(("warning", f"無効な色数値: {self.colors.get()}。デフォルトの256色を使用します。"))
-                colors_val = 256
-
-            # パレット生成 + 適用（改良版）
-            if vf_filters:
-                filter_chain = ",".join(vf_filters)
-                full_filter = f"{filter_chain},split[s0][s1];[s0]palettegen=max_colors={colors_val}:stats_mode=diff[p];[s1][p]paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
-            else:
-                full_filter = f"split[s0][s1];[s0]palettegen=max_colors={colors_val}:stats_mode=diff[p];[s1][p]paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
-            
-            command.extend(["-vf", full_filter, "-loop", loop, "-y", output_file])
-            return command
+    def build_output_path(self, file_path, output_dir, is_batch):
+        """出力GIFのパス（トリミング時は範囲をファイル名に含める）"""
+        if self.enable_trim.get() and not is_batch:
+            start_time = self.trim_start_ratio * self.video_duration
+            end_time = self.trim_end_ratio * self.video_duration
+            return os.path.join(output_dir, gif_output_name(file_path, start_time, end_time))
+        return os.path.join(output_dir, gif_output_name(file_path))
+
+    def notify_progress(self, kind, message):
+        """GifEncoderからの通知をUIスレッド向けのキューに積む"""
+        self.progress_queue.put((kind, message))
+
+    def collect_settings(self):
+        """Tk変数から変換設定を辞書として取り出す"""
+        settings = {
+            'fps': self.fps.get(),
+            'keep_fps': self.keep_fps.get(),
+            'original_fps': self.original_fps,
+            'width': self.width.get(),
+            'height': self.height.get(),
+            'keep_aspect': self.keep_aspect.get(),
+            'keep_res': self.keep_res.get(),
+            'half_res': self.half_res.get(),
+            'colors': self.colors.get(),
+            'loop': self.is_loop.get(),
+            'trim_start': None,
+            'trim_end': None,
+            'parallel_chunks': self.parallel_chunks.get(),
+            'memory_limit_mb': self.memory_limit.get(),
+            'source_width': self.video_width,
+            'source_height': self.video_height,
+            'source_duration': self.video_duration,
+        }
+        if self.enable_trim.get():
+            settings['trim_start'] = self.trim_start_ratio * self.video_duration
+            settings['trim_end'] = self.trim_end_ratio * self.video_duration
+        return settings
 
+    def build_ffmpeg_command(self, input_file, output_file):
+        """FFmpegコマンドを構築 - 改良版"""
+        try:
+            encoder = GifEncoder(self.ffmpeg_path, self.collect_settings(), self.notify_progress)
+            return encoder.build_command(input_file, output_file)
         except Exception as e:
             self.progress_queue.put(("warning", f"コマンド構築エラー: {e}"))
             return None
@@ -880,8 +3022,16 @@ class Mp4ToGifConverter(tk.Tk):
                     self.log_text.insert(tk.END, data + "\n")
                     self.log_text.see(tk.END)
                     self.log_text.config(state=tk.DISABLED)
+                elif msg_type == "preview":
+                    self.show_preview(data)
+                    self.progress_label.config(text="待機中...")
+                elif msg_type == "enable_preview":
+                    self.preview_button.config(state=tk.NORMAL)
+                    if "プレビュー" in self.progress_label.cget("text"):
+                        self.progress_label.config(text="待機中...")
                 elif msg_type == "enable_button":
                     self.convert_button.config(state=tk.NORMAL)
+                    self.job_file_button.config(state=tk.NORMAL)
                     if "エラー" not in self.progress_label.cget("text"):
                         self.progress_label.config(text="待機中...")
         except queue.Empty:
@@ -890,6 +3040,59 @@ class Mp4ToGifConverter(tk.Tk):
             self.after(100, self.process_queue)
 
 def main():
+    parser = argparse.ArgumentParser(description="MP4 to GIF Converter")
+    parser.add_argument("--serve", action="store_true", help="GUIを起動せず、ローカルHTTP変換サービスとして動かす")
+    parser.add_argument("--host", default="127.0.0.1", help="サービスの待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=SERVICE_DEFAULT_PORT, help="サービスの待ち受けポート")
+    parser.add_argument("--workers", type=int, default=None, help="同時に変換するジョブ数")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "mp4togif_service"),
+                        help="アップロードと変換結果を置くフォルダ")
+    parser.add_argument("--cache-dir", default=None, help="変換結果キャッシュのフォルダ（共有フォルダも可）")
+    parser.add_argument("--cache-limit-mb", type=int, default=DEFAULT_CACHE_LIMIT_MB, help="変換結果キャッシュの容量上限")
+    parser.add_argument("--max-upload-mb", type=int, default=SERVICE_MAX_UPLOAD_MB,
+                        help="サービスに送信できる動画本体の最大サイズ（超えると413）")
+    parser.add_argument("--job-file", default=None, help="GUIを起動せず、ジョブファイル（.json / .toml）を実行する")
+    parser.add_argument("--no-cache", action="store_true", help="ジョブファイル実行時に変換結果キャッシュを使わない")
+    args = parser.parse_args()
+
+    if args.job_file:
+        ffmpeg_path = locate_ffmpeg()
+        if not ffmpeg_path:
+            print("FFmpegが見つかりません。PATHに追加するか ffmpeg_path.txt にパスを書いてください。")
+            sys.exit(1)
+
+        def notify(kind, message):
+            if kind in ("log", "warning", "label"):
+                print(message)
+
+        cache = None if args.no_cache else OutputCache(args.cache_dir, args.cache_limit_mb)
+        try:
+            results = run_job_file(ffmpeg_path, args.job_file, notify, cache)
+        except (ValueError, OSError) as e:
+            print(f"ジョブファイルエラー: {e}")
+            sys.exit(2)
+        failed = [result for result in results if result[2] != 0]
+        print(f"完了: {len(results) - len(failed)}/{len(results)}件成功")
+        sys.exit(1 if failed else 0)
+
+    if args.serve:
+        ffmpeg_path = locate_ffmpeg()
+        if not ffmpeg_path:
+            print("FFmpegが見つかりません。PATHに追加するか ffmpeg_path.txt にパスを書いてください。")
+            sys.exit(1)
+        cache = OutputCache(args.cache_dir, args.cache_limit_mb)
+        service = ConversionService(ffmpeg_path, args.work_dir, args.host, args.port, args.workers, cache=cache,
+                                    max_upload_mb=args.max_upload_mb)
+        host, port = service.address
+        print(f"変換サービス起動: http://{host}:{port}/jobs （ワーカー数: {service.worker_count}）")
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+        return
+
     app = Mp4ToGifConverter()
     if app.winfo_exists():
         app.mainloop()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MP4toGifconv  # noqa: E402
+
+
+@pytest.fixture
+def fake_caps(monkeypatch):
+    """実行ファイルを調べずに、機能を指定したFFmpegCapabilitiesを使う"""
+    caps = MP4toGifconv.FFmpegCapabilities("ffmpeg")
+    caps.filters = {"paletteuse", "palettegen", "scale", "fps", "split", "pad"}
+    caps.paletteuse_options = {"dither", "bayer_scale", "diff_mode"}
+    monkeypatch.setattr(MP4toGifconv.FFmpegCapabilities, "probe", classmethod(lambda cls, path: caps))
+    return caps
+
+
+@pytest.fixture
+def messages():
+    """GifEncoder の notify に渡して通知を記録する"""
+    received = []
+
+    def notify(kind, message):
+        received.append((kind, message))
+
+    notify.received = received
+    return notify
+
+
+class FakeVar:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+@pytest.fixture
+def gui_state():
+    """Tkを起動せずに Mp4ToGifConverter のメソッドを呼ぶための状態を作る"""
+    def make(**values):
+        defaults = dict(fps="20", keep_fps=False, width="640", height="360", keep_aspect=True, keep_res=True,
+                        half_res=False, colors="128", is_loop=True, enable_trim=True, parallel_chunks=False,
+                        memory_limit="2048")
+        defaults.update(values)
+        state = types.SimpleNamespace(**{name: FakeVar(value) for name, value in defaults.items()})
+        state.original_fps = 25.0
+        state.video_width, state.video_height = 320, 240
+        return state
+    return make
+
+
+@pytest.fixture(scope="session")
+def ffmpeg_path():
+    path = shutil.which("ffmpeg")
+    if not path:
+        pytest.skip("ffmpeg がインストールされていません")
+    return path
+
+
+def make_clip(ffmpeg_path, path, seconds, size="320x240", rate=25):
+    """testsrc から合成したMP4を作る（キーフレームは1秒ごと）"""
+    command = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate={rate}:duration={seconds}",
+        "-c:v", "mpeg4", "-q:v", "5", "-g", str(rate), "-pix_fmt", "yuv420p",
+        "-y", path
+    ]
+    subprocess.run(command, check=True)
+    return path
+
+
+@pytest.fixture(scope="session")
+def synthetic_clip(ffmpeg_path, tmp_path_factory):
+    """4秒 / 320x240 / 25fps の合成動画"""
+    return make_clip(ffmpeg_path, str(tmp_path_factory.mktemp("clips") / "clip.mp4"), 4)
+
+
+@pytest.fixture(scope="session")
+def long_clip(ffmpeg_path, tmp_path_factory):
+    """チャンク分割の対象になる12秒 / 160x120 / 25fps の合成動画"""
+    return make_clip(ffmpeg_path, str(tmp_path_factory.mktemp("clips") / "long.mp4"), 12, size="160x120")
+
+
+@pytest.fixture(scope="session")
+def budget_clip(ffmpeg_path, tmp_path_factory):
+    """変換時間の計測用（計測の揺らぎが小さくなる長さ）の10秒 / 320x240 / 25fps の合成動画"""
+    return make_clip(ffmpeg_path, str(tmp_path_factory.mktemp("clips") / "budget.mp4"), 10)
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+import MP4toGifconv
+from MP4toGifconv import GifEncoder, Mp4ToGifConverter, normalize_settings
+
+PALETTEUSE = "paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
+
+
+def encoder(notify=None, **overrides):
+    return GifEncoder("ffmpeg", normalize_settings(overrides), notify)
+
+
+def test_default_command(fake_caps):
+    command = encoder().build_command("in.mp4", "out.gif")
+    assert command == [
+        "ffmpeg", "-i", "in.mp4",
+        "-vf", f"fps=30,split[s0][s1];[s0]palettegen=max_colors=256:stats_mode=diff[p];[s1][p]{PALETTEUSE}",
+        "-loop", "0", "-f", "gif", "-y", "out.gif",
+    ]
+
+
+def test_trim_seeks_before_input(fake_caps):
+    command = encoder(trim_start=1.5, trim_end=4.0).build_command("in.mp4", "out.gif")
+    assert command[:6] == ["ffmpeg", "-ss", "1.5", "-t", "2.5", "-i"]
+
+
+def test_resize_keeps_aspect_with_pad(fake_caps):
+    command = encoder(keep_res=False, width=480, height=270, fps=15, colors=64).build_command("in.mp4", "out.gif")
+    graph = command[command.index("-vf") + 1]
+    assert graph.startswith("fps=15,scale=480:270:flags=lanczos:force_original_aspect_ratio=decrease,"
+                            "pad=480:270:(ow-iw)/2:(oh-ih)/2,split")
+    assert "max_colors=64" in graph
+
+
+def test_keep_fps_uses_probed_rate(fake_caps, messages):
+    settings = normalize_settings({"keep_fps": True})
+    settings["original_fps"] = 30000 / 1001
+    graph = GifEncoder("ffmpeg", settings, messages).build_command("in.mp4", "out.gif")[4]
+    assert graph.startswith("fps=29.970030,split")
+
+
+def test_invalid_values_fall_back_with_warnings(fake_caps, messages):
+    # GUIの入力欄の値は検証せずに渡され、変換時に既定値へ戻される
+    settings = dict(MP4toGifconv.DEFAULT_SETTINGS, fps="abc", colors="999", keep_res=False, width="0", height="10")
+    command = GifEncoder("ffmpeg", settings, messages).build_command("in.mp4", "out.gif")
+    graph = command[command.index("-vf") + 1]
+    assert graph.startswith("fps=30,split")
+    assert "max_colors=256" in graph
+    assert [kind for kind, _ in messages.received].count("warning") == 3
+
+
+def test_no_loop(fake_caps):
+    command = encoder(loop=False).build_command("in.mp4", "out.gif")
+    assert command[command.index("-loop") + 1] == "-1"
+
+
+def test_capabilities_select_fast_path(fake_caps):
+    fake_caps.has_threads = True
+    fake_caps.filters.add("zscale")
+    fake_caps.paletteuse_options = {"dither", "bayer_scale"}
+    command = encoder(half_res=True, keep_res=False).build_command("in.mp4", "out.gif")
+    assert "-threads" not in command  # スレッド数は ffmpeg の自動設定に任せる
+    graph = command[command.index("-vf") + 1]
+    assert graph.startswith("fps=30,zscale=")
+    assert graph.endswith("paletteuse=dither=bayer:bayer_scale=5")
+
+
+def test_thread_options(fake_caps):
+    assert fake_caps.decode_options(threads=2) == []
+    assert fake_caps.filter_thread_options(2) == []
+    fake_caps.has_threads = True
+    fake_caps.has_filter_complex_threads = True
+    assert fake_caps.decode_options() == []
+    assert fake_caps.decode_options(threads=2) == ["-threads", "2"]
+    assert fake_caps.filter_thread_options(2) == ["-filter_complex_threads", "2"]
+
+
+def test_memory_estimate_and_two_stage_palette(fake_caps):
+    settings = normalize_settings({"memory_limit_mb": 100})
+    settings.update(source_width=3840, source_height=2160, source_duration=60.0)
+    gif = GifEncoder("ffmpeg", settings)
+    assert gif.estimate_single_pass_memory() == 3840 * 2160 * MP4toGifconv.BUFFERED_BYTES_PER_PIXEL * 1800
+    assert gif.estimate_single_pass_memory() > gif.memory_limit_bytes()
+    assert gif.build_palette_filter(["fps=30"], 64, sampled=True) == (
+        "fps=30,fps=2,scale='min(iw,480)':-2:flags=area,palettegen=max_colors=64:stats_mode=full")
+    assert gif.build_paletteuse_graph([]) == f"[0:v][1:v]{PALETTEUSE}"
+
+
+def test_plan_chunks_snaps_to_keyframes(fake_caps):
+    gif = encoder()
+    keyframes = [0, 8, 16, 24, 33, 41, 50, 58, 66, 75, 83, 91]
+    assert gif.plan_chunks(0, 100, keyframes, 4) == [(0, 24), (24, 50), (50, 75), (75, 100)]
+    assert gif.plan_chunks(0, 100, [], 4) == [(0, 25.0), (25.0, 50.0), (50.0, 75.0), (75.0, 100)]
+    assert gif.plan_chunks(0, 7, keyframes, 4) == [(0, 7)]
+
+
+def test_plan_chunks_aligns_to_output_frames(fake_caps):
+    # 境界を出力フレームの時刻に揃え、チャンクごとの fps フィルタでフレームが増えないようにする
+    keyframes = [8.35, 16.7, 25.05]
+    chunks = encoder(fps="15").plan_chunks(1.0, 31.34, keyframes, 4)
+    assert len(chunks) == 4
+    for chunk_start, _ in chunks[1:]:
+        frames = (chunk_start - 1.0) * 15
+        assert frames == pytest.approx(round(frames))
+    # 元のフレームを使う場合はフレームの中間で切る
+    gif = encoder(keep_fps=True)
+    gif.settings["original_fps"] = 30.0
+    chunks = gif.plan_chunks(0, 31.34, keyframes, 4)
+    assert len(chunks) == 4
+    for chunk_start, _ in chunks[1:]:
+        assert chunk_start * 30 % 1 == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("start_ratio, end_ratio, duration, expected", [
+    (0.0, 1.0, 10.0, (0.0, 10.0)),
+    (0.25, 0.75, 8.0, (2.0, 6.0)),
+    (0.1, 0.35, 123.4, (12.34, 43.19)),
+])
+def test_trim_ratio_math(gui_state, start_ratio, end_ratio, duration, expected):
+    state = gui_state()
+    state.trim_start_ratio, state.trim_end_ratio, state.video_duration = start_ratio, end_ratio, duration
+    settings = Mp4ToGifConverter.collect_settings(state)
+    assert settings["trim_start"] == pytest.approx(expected[0])
+    assert settings["trim_end"] == pytest.approx(expected[1])
+
+
+def test_trim_disabled_and_output_name(gui_state):
+    state = gui_state(enable_trim=False)
+    state.trim_start_ratio, state.trim_end_ratio, state.video_duration = 0.5, 1.0, 10.0
+    settings = Mp4ToGifConverter.collect_settings(state)
+    assert settings["trim_start"] is None and settings["trim_end"] is None
+    assert MP4toGifconv.gif_output_name("/v/clip.mp4") == "clip.gif"
+    assert MP4toGifconv.gif_output_name("/v/clip.mp4", 65.2, 130.9) == "clip_trim_01m05s_02m10s.gif"
+
+
+def test_memory_watch_reports_unavailable_rss_once(fake_caps, messages, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "process_rss_bytes", lambda pid: None)
+    gif = encoder(messages)
+
+    class Running:
+        pid = 1
+
+        def poll(self):
+            return None
+
+    for _ in range(2):
+        watch = gif.watch_memory(Running(), 1024)
+        assert not watch.wait(0.2)
+    time.sleep(0.1)
+    notices = [message for _, message in messages.received if "psutil" in message]
+    assert len(notices) == 1
@@ -0,0 +1,58 @@
+import pytest
+from PIL import Image, ImageSequence
+
+from MP4toGifconv import iter_gif_frames, join_gif_files, load_preview_frames, read_gif_header
+
+
+def write_gif(path, colors, duration, loop=True):
+    frames = [Image.new("RGB", (16, 12), color) for color in colors]
+    options = {"loop": 0} if loop else {}
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, **options)
+    return str(path)
+
+
+def test_join_keeps_frames_delays_and_colors(tmp_path):
+    first = write_gif(tmp_path / "a.gif", [(255, 0, 0), (0, 255, 0)], 100)
+    second = write_gif(tmp_path / "b.gif", [(0, 0, 255), (255, 255, 0), (0, 255, 255)], 40, loop=False)
+    output = str(tmp_path / "joined.gif")
+    join_gif_files([first, second], output)
+
+    with Image.open(output) as image:
+        assert image.info.get("loop") == 0
+        frames = [(frame.convert("RGB").getpixel((0, 0)), frame.info["duration"])
+                  for frame in ImageSequence.Iterator(image)]
+    assert frames == [
+        ((255, 0, 0), 100), ((0, 255, 0), 100),
+        ((0, 0, 255), 40), ((255, 255, 0), 40), ((0, 255, 255), 40),
+    ]
+
+
+def test_join_without_loop(tmp_path):
+    only = write_gif(tmp_path / "a.gif", [(10, 20, 30), (40, 50, 60)], 50)
+    output = str(tmp_path / "joined.gif")
+    join_gif_files([only], output, loop=False)
+    with open(output, "rb") as f:
+        assert b"NETSCAPE2.0" not in f.read()
+        f.seek(0)
+        read_gif_header(f)
+        assert len(list(iter_gif_frames(f))) == 2
+
+
+def test_join_rejects_truncated_input(tmp_path):
+    whole = write_gif(tmp_path / "a.gif", [(1, 2, 3), (4, 5, 6)], 50)
+    with open(whole, "rb") as f:
+        data = f.read()
+    (tmp_path / "cut.gif").write_bytes(data[:-20])
+    with pytest.raises(ValueError):
+        join_gif_files([str(tmp_path / "cut.gif")], str(tmp_path / "joined.gif"))
+
+
+def test_preview_frames_are_downscaled_and_capped(tmp_path):
+    frames = [Image.new("RGB", (640, 360), (index * 2, 0, 0)) for index in range(30)]
+    path = str(tmp_path / "big.gif")
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=40, loop=0)
+
+    preview = load_preview_frames(path, max_size=160, max_frames=8)
+    assert len(preview) == 8
+    assert all(image.size == (160, 90) for image, _ in preview)
+    assert sum(duration for _, duration in preview) == 30 * 40
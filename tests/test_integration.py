@@ -0,0 +1,192 @@
+"""
+合成動画（ffmpeg の testsrc）を実際に変換する結合テスト。ffmpeg が無ければスキップ
+出力サイズと変換時間は tests/golden_metrics.json の基準値と比較する
+（変換時間は同じ実行内で計測した固定のffmpegコマンドとの比。UPDATE_GOLDEN=1 で実行すると基準値を書き換える）
+"""
+import json
+import os
+import subprocess
+import time
+import urllib.request
+
+import pytest
+from PIL import Image, ImageSequence
+
+import MP4toGifconv
+from MP4toGifconv import (ConversionService, FFmpegCapabilities, GifEncoder, OutputCache, normalize_settings,
+                          probe_video_info, probe_with_ffmpeg)
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_metrics.json")
+
+
+def gif_timing(path):
+    """(フレーム数, 表示時間の合計秒)"""
+    with Image.open(path) as image:
+        delays = [frame.info.get("duration", 0) for frame in ImageSequence.Iterator(image)]
+    return len(delays), sum(delays) / 1000
+
+
+def make_encoder(ffmpeg_path, clip, messages=None, **overrides):
+    settings = normalize_settings(overrides)
+    info = probe_video_info(FFmpegCapabilities.probe(ffmpeg_path), clip)
+    settings.update(original_fps=info["fps"], source_width=info["width"],
+                    source_height=info["height"], source_duration=info["duration"])
+    return GifEncoder(ffmpeg_path, settings, messages), info
+
+
+def test_probe_synthetic_clip(ffmpeg_path, synthetic_clip):
+    info = probe_video_info(FFmpegCapabilities.probe(ffmpeg_path), synthetic_clip)
+    assert info["duration"] == pytest.approx(4.0, abs=0.05)
+    assert info["fps"] == pytest.approx(25.0)
+    assert (info["width"], info["height"]) == (320, 240)
+    # ヘッダ解析による代替手段でも同じ結果になる
+    fallback = probe_with_ffmpeg(ffmpeg_path, synthetic_clip)
+    assert fallback["duration"] == pytest.approx(info["duration"], abs=0.01)
+    assert (fallback["fps"], fallback["width"], fallback["height"]) == (25.0, 320, 240)
+
+
+def test_trimmed_frame_count_and_duration(ffmpeg_path, synthetic_clip, tmp_path, messages):
+    encoder, _ = make_encoder(ffmpeg_path, synthetic_clip, messages, fps=10, trim_start=1.0, trim_end=3.0)
+    output = str(tmp_path / "trim.gif")
+    assert encoder.encode(synthetic_clip, output) == 0
+    frames, seconds = gif_timing(output)
+    assert frames == pytest.approx(20, abs=1)
+    assert seconds == pytest.approx(2.0, abs=0.1)
+    with Image.open(output) as image:
+        assert image.size == (320, 240)
+        assert image.info.get("loop") == 0
+
+
+def test_two_stage_matches_single_pass(ffmpeg_path, synthetic_clip, tmp_path, messages):
+    encoder, _ = make_encoder(ffmpeg_path, synthetic_clip, messages, fps=10, half_res=True)
+    single, staged = str(tmp_path / "single.gif"), str(tmp_path / "staged.gif")
+    assert encoder.encode(synthetic_clip, single) == 0
+    assert encoder.encode_two_stage(synthetic_clip, staged) == 0
+    assert gif_timing(staged) == gif_timing(single)
+    with Image.open(staged) as image:
+        assert image.size == (160, 120)
+
+
+def test_chunked_matches_single_pass(ffmpeg_path, long_clip, tmp_path, messages, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv.os, "cpu_count", lambda: 2)
+    encoder, info = make_encoder(ffmpeg_path, long_clip, messages, fps=10, parallel_chunks=True)
+    single, chunked = str(tmp_path / "single.gif"), str(tmp_path / "chunked.gif")
+    assert encoder.encode(long_clip, single) == 0
+    assert encoder.encode_chunked(long_clip, chunked, info["duration"]) == 0
+    assert any("チャンクを連結" in message for _, message in messages.received)
+
+    frames, seconds = gif_timing(chunked)
+    single_frames, single_seconds = gif_timing(single)
+    assert frames == pytest.approx(single_frames, abs=1)
+    assert seconds == pytest.approx(single_seconds, abs=0.15)
+    assert seconds == pytest.approx(12.0, abs=0.2)
+
+
+@pytest.mark.parametrize("overrides", [{"fps": 15}, {"keep_fps": True}])
+def test_chunked_frame_count_with_many_chunks(ffmpeg_path, tmp_path, messages, monkeypatch, overrides):
+    # 29.97fps・不規則なキーフレーム間隔の動画を3チャンク以上に分けても、フレーム数は1パスと同じ
+    clip = str(tmp_path / "ntsc.mp4")
+    subprocess.run([ffmpeg_path, "-v", "error", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=30000/1001",
+                    "-t", "16.34", "-g", "47", "-pix_fmt", "yuv420p", "-y", clip], check=True)
+    monkeypatch.setattr(MP4toGifconv.os, "cpu_count", lambda: 4)
+    encoder, info = make_encoder(ffmpeg_path, clip, messages, parallel_chunks=True, **overrides)
+    assert len(encoder.plan_chunks(0.0, info["duration"], encoder.keyframe_times(clip, 0.0, info["duration"]), 4)) > 2
+    single, chunked = str(tmp_path / "single.gif"), str(tmp_path / "chunked.gif")
+    assert encoder.encode(clip, single) == 0
+    assert encoder.encode_chunked(clip, chunked, info["duration"]) == 0
+    assert gif_timing(chunked)[0] == gif_timing(single)[0]
+
+
+def test_service_round_trip(ffmpeg_path, synthetic_clip, tmp_path):
+    service = ConversionService(ffmpeg_path, str(tmp_path / "work"), port=0, workers=1,
+                                cache=OutputCache(str(tmp_path / "cache")))
+    service.start()
+    host, port = service.address
+    base = f"http://{host}:{port}"
+
+    def submit():
+        body = json.dumps({"input": synthetic_clip, "settings": {"fps": "5", "colors": "32"}}).encode("utf-8")
+        request = urllib.request.Request(f"{base}/jobs", data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.load(response)
+
+    try:
+        job = submit()
+        deadline = time.monotonic() + 60
+        while job["status"] not in ("done", "failed") and time.monotonic() < deadline:
+            time.sleep(0.2)
+            with urllib.request.urlopen(f"{base}/jobs/{job['id']}", timeout=10) as response:
+                job = json.load(response)
+        assert job["status"] == "done", job
+        with urllib.request.urlopen(f"{base}/jobs/{job['id']}/result", timeout=10) as response:
+            assert response.read(6) == b"GIF89a"
+        # 結果はキャッシュから返し、作業フォルダには残さない
+        assert service.get_job(job["id"])["output"].startswith(str(tmp_path / "cache"))
+        assert os.listdir(tmp_path / "work" / "results") == []
+
+        again = submit()
+        assert again["status"] == "done" and again["cache_hit"]
+    finally:
+        service.stop()
+
+
+GOLDEN_CASES = {
+    "default": {},
+    "half_res_fps10": {"fps": 10, "half_res": True},
+    "trim_2_6_colors64": {"fps": 15, "colors": 64, "trim_start": 2.0, "trim_end": 6.0},
+}
+TIMING_REPEATS = 3
+
+
+def best_time(run):
+    """run() を TIMING_REPEATS 回実行した最短時間（秒）。他の処理による揺らぎを除く"""
+    times = []
+    for _ in range(TIMING_REPEATS):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+@pytest.fixture(scope="module")
+def reference_seconds(ffmpeg_path, budget_clip, tmp_path_factory):
+    """
+    アプリを通さない固定のGIF変換コマンドの所要時間
+    変換時間はこれとの比で比較するため、マシンの速さによらず性能の劣化だけを検出できる
+    """
+    output = str(tmp_path_factory.mktemp("reference") / "reference.gif")
+    command = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-i", budget_clip,
+               "-vf", "fps=15,split[a][b];[a]palettegen[p];[b][p]paletteuse", "-f", "gif", "-y", output]
+    return best_time(lambda: subprocess.run(command, check=True))
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        metrics = json.load(f)
+    yield metrics
+    if os.environ.get("UPDATE_GOLDEN") == "1":
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+@pytest.mark.parametrize("name", sorted(GOLDEN_CASES))
+def test_output_size_and_time_budget(ffmpeg_path, budget_clip, reference_seconds, tmp_path, messages, golden, name):
+    encoder, _ = make_encoder(ffmpeg_path, budget_clip, messages, **GOLDEN_CASES[name])
+    output = str(tmp_path / f"{name}.gif")
+    returncodes = []
+    elapsed = best_time(lambda: returncodes.append(encoder.encode(budget_clip, output)))
+    assert returncodes == [0] * TIMING_REPEATS
+    size = os.path.getsize(output)
+    relative_time = elapsed / reference_seconds
+
+    if os.environ.get("UPDATE_GOLDEN") == "1":
+        golden["cases"][name] = {"size": size, "relative_time": round(relative_time, 3)}
+        return
+    expected = golden["cases"][name]
+    assert size == pytest.approx(expected["size"], rel=golden["size_tolerance"]), \
+        f"{name}: 出力サイズ {size} が基準値 {expected['size']} から外れています"
+    budget = expected["relative_time"] * golden["time_tolerance"]
+    assert relative_time <= budget, \
+        f"{name}: 変換時間 {elapsed:.2f}秒（基準コマンドの{relative_time:.2f}倍）が予算（{budget:.2f}倍）を超えています"
@@ -0,0 +1,267 @@
+import json
+import os
+import queue as queue_module
+
+import pytest
+
+import MP4toGifconv
+from MP4toGifconv import (JOB_DONE, JOB_FAILED, JOB_PENDING, PALETTE_FULL, PALETTE_SAMPLED, JobQueue, OutputCache,
+                          load_job_file, normalize_settings, settings_fingerprint)
+
+
+def test_normalize_settings():
+    settings = normalize_settings({"fps": 15, "loop": "false", "trim_start": "1", "trim_end": 2.5})
+    assert settings["fps"] == "15"
+    assert settings["loop"] is False
+    assert (settings["trim_start"], settings["trim_end"]) == (1.0, 2.5)
+    assert normalize_settings({"colors": 64.0, "memory_limit_mb": 0, "width": " 320 "})["width"] == "320"
+
+
+@pytest.mark.parametrize("overrides", [
+    {"speed": 2}, {"loop": "maybe"}, {"trim_start": 1}, {"trim_start": 3, "trim_end": 2},
+    {"fps": "abc"}, {"fps": True}, {"fps": 0}, {"fps": 12.5}, {"colors": 9999}, {"colors": 1},
+    {"width": -1}, {"height": [360]}, {"memory_limit_mb": "lots"}, {"memory_limit_mb": -1},
+    {"trim_start": True, "trim_end": 2}, {"trim_start": 0, "trim_end": "inf"}, {"trim_start": "x", "trim_end": 1},
+])
+def test_normalize_settings_rejects(overrides):
+    with pytest.raises(ValueError):
+        normalize_settings(overrides)
+
+
+def test_fingerprint_ignores_unused_values():
+    base = normalize_settings({})
+    assert settings_fingerprint(base) == settings_fingerprint(dict(base, width="1920", memory_limit_mb="64"))
+    assert settings_fingerprint(dict(base, keep_fps=True)) == settings_fingerprint(dict(base, keep_fps=True, fps="12"))
+    assert settings_fingerprint(base) != settings_fingerprint(dict(base, colors="64"))
+    assert settings_fingerprint(dict(base, trim_start=1.00001, trim_end=2.0)) == \
+        settings_fingerprint(dict(base, trim_start=1.0, trim_end=2.0))
+
+
+def test_load_job_file(tmp_path):
+    for name in ("b.mp4", "a.mp4", "intro.mp4"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "jobs.toml").write_text(
+        'workers = 2\n'
+        '[defaults]\nfps = 15\n'
+        '[[items]]\ninput = "intro.mp4"\ntrim = [1.5, 6]\n'
+        '[[items]]\ninput = "[ab].mp4"\n[items.settings]\nhalf_res = true\n',
+        encoding="utf-8")
+    job = load_job_file(str(tmp_path / "jobs.toml"))
+    assert job["workers"] == 2
+    outputs = [os.path.basename(item["output"]) for item in job["items"]]
+    assert outputs == ["intro_trim_00m01s_00m06s.gif", "a.gif", "b.gif"]
+    assert all(item["settings"]["fps"] == "15" for item in job["items"])
+    assert [item["settings"]["half_res"] for item in job["items"]] == [False, True, True]
+
+
+@pytest.mark.parametrize("content, message", [
+    ({"items": []}, "items"),
+    ({"items": ["missing.mp4"]}, "items[0]"),
+    ({"defaults": {"loop": "sometimes"}, "items": ["clip.mp4"]}, "defaults"),
+    ({"items": ["clip.mp4", {"input": "clip.mp4", "output": "b.gif", "settings": {"colors": 9999}}]}, "items[1]: colors"),
+    ({"items": [{"input": "clip.mp4", "trim": [1]}]}, "trim"),
+    ({"items": ["clip.mp4"], "verbose": True}, "verbose"),
+])
+def test_load_job_file_rejects(tmp_path, content, message):
+    (tmp_path / "clip.mp4").write_bytes(b"")
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps(content), encoding="utf-8")
+    with pytest.raises(ValueError, match=message.replace("[", r"\[")):
+        load_job_file(str(path))
+
+
+def test_job_queue_resume_and_retry(tmp_path, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "JOB_RETRY_BASE_DELAY", 0)
+    source = str(tmp_path / "in.mp4")
+    with open(source, "wb") as f:
+        f.write(b"video")
+    output = str(tmp_path / "out.gif")
+    settings = normalize_settings({})
+    queue = JobQueue(str(tmp_path))
+    assert queue.enqueue(source, output, settings) == JOB_PENDING
+
+    returncodes = iter([255, 0])
+
+    def convert(temp_path):
+        with open(temp_path, "wb") as f:
+            f.write(b"GIF89a")
+        return next(returncodes)
+
+    logs = []
+    assert queue.run(source, output, convert, lambda kind, message: logs.append(kind)) == 0
+    assert logs == ["log"]
+    assert queue.status(source, output) == JOB_DONE
+    assert not os.path.exists(output + ".part")
+    assert queue.enqueue(source, output, settings) == JOB_DONE
+    assert queue.enqueue(source, output, dict(settings, colors="64")) == JOB_PENDING
+    assert queue.run(source, output, lambda temp_path: 1, logs.append) == 1
+    assert queue.status(source, output) == JOB_FAILED
+    queue.close()
+
+    queue = JobQueue(str(tmp_path))
+    assert queue.recovered == 0
+    queue.close()
+
+
+def test_job_queue_reconverts_replaced_input(tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"first take")
+    output = str(tmp_path / "out.gif")
+    settings = normalize_settings({})
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue(str(source), output, settings)
+    queue.run(str(source), output, lambda temp_path: open(temp_path, "wb").close() or 0, None)
+    assert queue.enqueue(str(source), output, settings) == JOB_DONE
+
+    source.write_bytes(b"second take")  # 同じ名前で書き出し直した
+    assert queue.enqueue(str(source), output, settings) == JOB_PENDING
+    queue.close()
+
+
+def test_sampled_palette_results_are_not_reused_without_a_limit(tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    output = str(tmp_path / "out.gif")
+    limited = normalize_settings({"memory_limit_mb": 64})
+    unlimited = normalize_settings({"memory_limit_mb": 0})
+    assert settings_fingerprint(limited, PALETTE_SAMPLED) != settings_fingerprint(limited, PALETTE_FULL)
+
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue(str(source), output, limited)
+    queue.run(str(source), output, lambda temp_path: open(temp_path, "wb").close() or 0, None,
+              fingerprint=lambda: settings_fingerprint(limited, PALETTE_SAMPLED))
+    assert queue.enqueue(str(source), output, limited) == JOB_DONE
+    assert queue.enqueue(str(source), output, unlimited) == JOB_PENDING
+    queue.close()
+
+
+def test_job_queue_recovers_interrupted_jobs(tmp_path):
+    output = str(tmp_path / "out.gif")
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue("in.mp4", output, normalize_settings({}))
+    queue._update("in.mp4", output, MP4toGifconv.JOB_RUNNING, count_attempt=True)
+    queue.close()  # 実行中のまま終了（異常終了を想定）
+
+    queue = JobQueue(str(tmp_path))
+    assert queue.recovered == 1
+    assert queue.status("in.mp4", output) == JOB_PENDING
+    queue.close()
+
+
+def test_batch_records_per_file_trim(tmp_path, monkeypatch, fake_caps, gui_state):
+    """バッチ変換の登録時の設定が、各ファイルの長さから計算したトリミング秒数になること"""
+    durations = {"a.mp4": 10.0, "b.mp4": 20.0}
+    for name in durations:
+        (tmp_path / name).write_bytes(b"")
+    state = gui_state(input_path=str(tmp_path), batch_mode=True)
+    state.trim_start_ratio, state.trim_end_ratio = 0.5, 1.0
+    state.ffmpeg_path, state.progress_queue = "ffmpeg", queue_module.Queue()
+    state.get_video_info = lambda path: setattr(state, "video_duration", durations[os.path.basename(path)])
+    state.collect_settings = lambda: MP4toGifconv.Mp4ToGifConverter.collect_settings(state)
+    state.build_output_path = lambda *args: MP4toGifconv.Mp4ToGifConverter.build_output_path(state, *args)
+    state.open_output_cache = lambda: None
+    state.notify_progress = lambda kind, message: None
+
+    encoded = {}
+
+    def convert(encoder, input_file, output_file, video_duration, cache=None):
+        encoded[os.path.basename(input_file)] = (encoder.settings["trim_start"], video_duration)
+        open(output_file, "wb").close()
+        return 0
+
+    monkeypatch.setattr(MP4toGifconv.GifEncoder, "convert", convert)
+    MP4toGifconv.Mp4ToGifConverter.run_conversion(state)
+    assert encoded == {"a.mp4": (5.0, 10.0), "b.mp4": (10.0, 20.0)}
+
+    # 同じ設定で再実行すると両方とも完了済みとしてスキップされる
+    encoded.clear()
+    MP4toGifconv.Mp4ToGifConverter.run_conversion(state)
+    assert encoded == {}
+
+
+def test_output_cache_lru(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"), limit_mb=1)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    settings = normalize_settings({})
+    keys = []
+    for index in range(3):
+        gif = tmp_path / f"{index}.gif"
+        gif.write_bytes(bytes([index]) * 400 * 1024)
+        key = cache.key(str(source), dict(settings, colors=str(16 + index)))
+        cache.store(key, str(gif))
+        os.utime(cache.path_for(key), (index, index))
+        keys.append(key)
+    cache.evict()
+
+    assert not cache.fetch(keys[0], str(tmp_path / "miss.gif"))
+    assert cache.fetch(keys[2], str(tmp_path / "hit.gif"))
+    assert (tmp_path / "hit.gif").read_bytes() == bytes([2]) * 400 * 1024
+
+
+def test_cache_errors_do_not_affect_conversion(tmp_path, monkeypatch, fake_caps, messages):
+    cache = OutputCache(str(tmp_path / "cache"))
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    output = tmp_path / "out.gif"
+
+    def unwritable(source_path, destination):
+        raise PermissionError("read-only cache")
+
+    monkeypatch.setattr(MP4toGifconv, "place_file", unwritable)
+    encoder = MP4toGifconv.GifEncoder("ffmpeg", normalize_settings({}), messages)
+    monkeypatch.setattr(encoder, "encode", lambda input_file, output_file: open(output_file, "wb").close() or 0)
+    assert encoder.convert(str(source), str(output), 4.0, cache) == 0
+    assert output.exists()
+    assert any("キャッシュに登録できませんでした" in message for _, message in messages.received)
+    assert not cache.fetch(cache.key(str(source), encoder.settings), str(tmp_path / "other.gif"))
+    assert cache.lookup(cache.key(str(source), encoder.settings)) is None
+
+
+def test_cache_records_palette_path(tmp_path, monkeypatch, fake_caps, messages):
+    cache = OutputCache(str(tmp_path / "cache"))
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    encoded = []
+
+    def make_encoder(memory_limit_mb):
+        encoder = MP4toGifconv.GifEncoder("ffmpeg", normalize_settings({"memory_limit_mb": memory_limit_mb}), messages)
+
+        def encode(input_file, output_file):
+            # 上限を超えて2段階変換に切り替わった場合を再現する
+            encoder.palette = PALETTE_SAMPLED if memory_limit_mb else PALETTE_FULL
+            encoded.append(memory_limit_mb)
+            with open(output_file, "wb") as f:
+                f.write(b"GIF89a")
+            return 0
+        monkeypatch.setattr(encoder, "encode", encode)
+        return encoder
+
+    assert make_encoder(64).convert(str(source), str(tmp_path / "a.gif"), 4.0, cache) == 0
+    reused = make_encoder(64)
+    assert reused.convert(str(source), str(tmp_path / "b.gif"), 4.0, cache) == 0
+    assert reused.palette == PALETTE_SAMPLED
+    assert encoded == [64]
+
+    # 上限なしの設定には間引いたパレットの結果を使わない
+    assert make_encoder(0).convert(str(source), str(tmp_path / "c.gif"), 4.0, cache) == 0
+    assert encoded == [64, 0]
+
+
+def test_job_queue_does_not_retry_memory_exhaustion(tmp_path, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "JOB_RETRY_BASE_DELAY", 0)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    output = str(tmp_path / "out.gif")
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue(str(source), output, normalize_settings({}))
+    calls = []
+
+    def convert(temp_path):
+        calls.append(temp_path)
+        return MP4toGifconv.MEMORY_EXCEEDED_RETURNCODE
+
+    assert queue.run(str(source), output, convert, None) == MP4toGifconv.MEMORY_EXCEEDED_RETURNCODE
+    assert len(calls) == 1
+    assert queue.status(str(source), output) == JOB_FAILED
+    queue.close()
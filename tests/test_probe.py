@@ -0,0 +1,81 @@
+import json
+import types
+
+import pytest
+
+import MP4toGifconv
+from MP4toGifconv import Mp4ToGifConverter, parse_ffmpeg_header, parse_ffprobe_output
+
+FFMPEG_HEADER = """\
+Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'clip.mp4':
+  Metadata:
+    major_brand     : isom
+  Duration: 00:01:23.45, start: 0.000000, bitrate: 1205 kb/s
+  Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), 1920x1080 [SAR 1:1 DAR 16:9], 1072 kb/s, 29.97 fps, 29.97 tbr, 30k tbn (default)
+  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 48000 Hz, stereo, fltp, 128 kb/s (default)
+At least one output file must be specified
+"""
+
+
+def ffprobe_json(rate, duration="12.500000"):
+    return json.dumps({
+        "streams": [
+            {"codec_type": "audio", "r_frame_rate": "0/0"},
+            {"codec_type": "video", "width": 640, "height": 360, "r_frame_rate": rate},
+        ],
+        "format": {"duration": duration},
+    })
+
+
+@pytest.mark.parametrize("rate, expected", [("30000/1001", 29.97003), ("25/1", 25.0), ("24", 24.0)])
+def test_ffprobe_output(rate, expected):
+    info = parse_ffprobe_output(ffprobe_json(rate))
+    assert info["duration"] == 12.5
+    assert info["fps"] == pytest.approx(expected)
+    assert (info["width"], info["height"]) == (640, 360)
+
+
+def test_ffmpeg_header():
+    assert parse_ffmpeg_header(FFMPEG_HEADER) == {
+        "duration": 83.45, "fps": 29.97, "width": 1920, "height": 1080}
+
+
+def test_ffmpeg_header_without_stream_details():
+    info = parse_ffmpeg_header("  Duration: 01:00:00.50, start: 0.000000, bitrate: N/A\n")
+    assert info == {"duration": 3600.5, "fps": None, "width": None, "height": None}
+
+
+def test_ffmpeg_header_without_duration():
+    assert parse_ffmpeg_header("clip.mp4: Invalid data found when processing input\n") is None
+
+
+def converter_state():
+    state = types.SimpleNamespace(ffmpeg_path="ffmpeg", video_duration=0, original_fps=30,
+                                  video_width=None, video_height=None)
+    state.apply_video_info = lambda info: Mp4ToGifConverter.apply_video_info(state, info)
+    return state
+
+
+def test_duration_fallback_uses_header(monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "probe_with_ffmpeg", lambda path, video: parse_ffmpeg_header(FFMPEG_HEADER))
+    state = converter_state()
+    assert Mp4ToGifConverter.get_duration_with_ffmpeg(state, "clip.mp4") == 83.45
+    assert state.original_fps == 29.97
+    assert (state.video_width, state.video_height) == (1920, 1080)
+
+
+def test_duration_fallback_default(monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "probe_with_ffmpeg", lambda path, video: None)
+    state = converter_state()
+    assert Mp4ToGifConverter.get_duration_with_ffmpeg(state, "clip.mp4") == 60
+    assert state.video_duration == 60
+
+
+def test_probe_falls_back_to_ffmpeg(monkeypatch):
+    calls = []
+    monkeypatch.setattr(MP4toGifconv, "probe_with_ffprobe", lambda path, video: calls.append("ffprobe"))
+    monkeypatch.setattr(MP4toGifconv, "probe_with_ffmpeg",
+                        lambda path, video: calls.append("ffmpeg") or {"duration": 1.0})
+    caps = types.SimpleNamespace(ffmpeg_path="ffmpeg", ffprobe_path="ffprobe")
+    assert MP4toGifconv.probe_video_info(caps, "clip.mp4") == {"duration": 1.0}
+    assert calls == ["ffprobe", "ffmpeg"]
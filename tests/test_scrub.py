@@ -0,0 +1,43 @@
+import pytest
+
+from MP4toGifconv import FrameScrubCache
+
+
+def solid_frame(cache, value):
+    return cache.compress(bytes([value % 256]) * cache.frame_size)
+
+
+def test_index_thins_instead_of_dropping_the_start():
+    cache = FrameScrubCache("ffmpeg", "clip.mp4", width=16, height=9, limit_mb=1)
+    frame_bytes = len(solid_frame(cache, 0))
+    total = (cache.limit_bytes // frame_bytes) * 3  # 容量上限の約3倍のフレーム数
+    for index in range(total):
+        if index % cache.step == 0:
+            cache.add_frame(index, solid_frame(cache, index))
+
+    assert cache.step == 4
+    assert cache.total_bytes <= cache.limit_bytes
+    assert sorted(cache.frames) == list(range(0, cache.last_index + 1, cache.step))
+    # 先頭も末尾も、要求時刻から step/2 以内のフレームが返る
+    for seconds in (0, 1.4, total / 2, total - 1):
+        image, frame_time = cache.frame_at(seconds)
+        assert image.size == (16, 9)
+        assert abs(frame_time - seconds) <= cache.step / 2
+
+
+def test_frame_at_before_and_beyond_decoded_range():
+    cache = FrameScrubCache("ffmpeg", "clip.mp4", width=16, height=9)
+    assert cache.frame_at(3.0) is None
+    for index in range(5):
+        cache.add_frame(index, solid_frame(cache, index * 40))
+    image, frame_time = cache.frame_at(100.0)
+    assert frame_time == 4
+    assert image.getpixel((8, 4))[0] == pytest.approx(160, abs=4)
+
+
+def test_integration_index_covers_whole_clip(ffmpeg_path, synthetic_clip):
+    cache = FrameScrubCache(ffmpeg_path, synthetic_clip)
+    cache.start()
+    assert cache.finished.wait(30)
+    assert cache.last_index >= 3
+    assert cache.frame_at(0)[1] == 0
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import MP4toGifconv
+from MP4toGifconv import ConversionService, OutputCache
+
+
+@pytest.fixture
+def service(tmp_path, fake_caps):
+    """ワーカーを起動しないサービス（登録と問い合わせだけを確認する）"""
+    service = ConversionService("ffmpeg", str(tmp_path / "work"), port=0, workers=1,
+                                cache=OutputCache(str(tmp_path / "cache")))
+    yield service
+    service.server.server_close()
+
+
+def post(service, body, content_type="application/json"):
+    host, port = service.address
+    request = urllib.request.Request(f"http://{host}:{port}/jobs", data=body,
+                                     headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b'{"input": 1}', b'{"input": "a.mp4", "settings": [1]}', b"{"])
+def test_malformed_requests_are_rejected(service, body):
+    thread = threading.Thread(target=service.server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        status, response = post(service, body)
+    finally:
+        service.server.shutdown()
+    assert status == 400
+    assert "error" in response
+
+
+def test_follow_skips_dropped_log_lines(service, tmp_path, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "SERVICE_LOG_LINES", 3)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    job = service.submit(str(source), {})
+    for index in range(10):
+        job["log"].append(f"line {index}")
+        job["log_count"] += 1
+    service.update_job(job, status="failed", error="stop", finished_at=time.time())
+    events = list(service.follow(job))
+    assert [event["log"] for event in events[:-1]] == ["line 7", "line 8", "line 9"]
+    assert events[-1]["status"] == "failed"
+
+
+def test_finished_jobs_expire(service, tmp_path, monkeypatch):
+    monkeypatch.setattr(MP4toGifconv, "SERVICE_MAX_FINISHED_JOBS", 2)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    fallback = tmp_path / "work" / "results" / "old.gif"
+    fallback.write_bytes(b"GIF89a")
+
+    old = service.submit(str(source), {})
+    service.update_job(old, status="done", output=str(fallback), finished_at=time.time() - MP4toGifconv.SERVICE_JOB_TTL - 1)
+    recent = []
+    for _ in range(3):
+        job = service.submit(str(source), {})
+        service.update_job(job, status="failed", finished_at=time.time())
+        recent.append(job)
+    pending = service.submit(str(source), {})
+
+    assert service.get_job(old["id"]) is None
+    assert not fallback.exists()
+    assert [service.get_job(job["id"]) is not None for job in recent] == [False, True, True]
+    assert service.get_job(pending["id"]) is pending
+
+
+def test_invalid_settings_are_rejected_before_queueing(service, tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    for settings in ({"colors": 9999}, {"fps": "fast"}, {"width": True}):
+        with pytest.raises(ValueError):
+            service.submit(str(source), settings)
+    assert service.list_jobs() == []
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"x" * 1000, "video/mp4"),
+    (b" " * (MP4toGifconv.SERVICE_MAX_JSON_BYTES + 1), "application/json"),
+])
+def test_oversized_requests_are_rejected(service, body, content_type):
+    service.max_upload_bytes = 100
+    thread = threading.Thread(target=service.server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        status, response = post(service, body, content_type)
+    finally:
+        service.server.shutdown()
+    assert status == 413
+    assert "error" in response
+    assert os.listdir(service.upload_dir) == []